@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.db")
+# Minimum cosine similarity between two questions for a cached answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_HOURS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, reused for near-identical questions
+
+    Entries belong to a scope (for example a PDF index version or a chat
+    mode) and are only matched within it. They expire after a TTL, the least
+    recently used ones are evicted beyond max_entries, and everything is
+    persisted in SQLite so the cache survives restarts.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds=ANSWER_CACHE_TTL_HOURS * 3600, max_entries=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # scope -> (entry IDs, matrix of normalized question vectors)
+        self._scopes = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (scope)")
+        self.conn.commit()
+
+    def embed_query(self, question):
+        """Question embedding as the model returns it, or None if the embedding model is unavailable
+
+        Callers that also search an index with the same model can reuse it
+        there, and pass it through normalize() for lookup and store.
+        """
+        # Imported on first use, so text-only sessions never import the embedding stack
+        from embeddings import get_embeddings
+        try:
+            return np.asarray(get_embeddings().embed_query(question), dtype=np.float32)
+        except Exception as e:
+            print(f"Answer cache disabled for this request: {e}")
+            return None
+
+    @staticmethod
+    def normalize(embedding):
+        if embedding is None:
+            return None
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def embed(self, question):
+        """Normalized question vector, or None if the embedding model is unavailable"""
+        return self.normalize(self.embed_query(question))
+
+    def _scope_matrix(self, scope):
+        if scope not in self._scopes:
+            rows = self.conn.execute(
+                "SELECT id, vector FROM answers WHERE scope = ? AND created > ?",
+                (scope, time.time() - self.ttl_seconds)
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+            self._scopes[scope] = (ids, matrix)
+        return self._scopes[scope]
+
+    def lookup(self, scope, vector):
+        """Cached answer to the most similar question in scope, or None"""
+        if vector is None:
+            return None
+        with self._lock:
+            ids, matrix = self._scope_matrix(scope)
+            if ids:
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self.conn.execute("SELECT answer, created FROM answers WHERE id = ?", (ids[best],)).fetchone()
+                    if row and time.time() - row[1] < self.ttl_seconds:
+                        self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+                        self.conn.commit()
+                        self.hits += 1
+                        return row[0]
+            self.misses += 1
+        return None
+
+    def store(self, scope, question, vector, answer):
+        """Remember an answer, evicting expired and least recently used entries"""
+        if vector is None:
+            return
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO answers (scope, question, answer, vector, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, question, answer, vector.astype(np.float32).tobytes(), now, now)
+            )
+            evicted = self.conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl_seconds,)).rowcount
+            evicted += self.conn.execute(
+                "DELETE FROM answers WHERE id IN "
+                "(SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self.conn.commit()
+            if evicted:
+                self._scopes.clear()
+            elif scope in self._scopes:
+                ids, matrix = self._scopes[scope]
+                row = vector[None, :].astype(np.float32)
+                self._scopes[scope] = (ids + [cursor.lastrowid], row if matrix is None else np.vstack([matrix, row]))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "entries": entries,
+        }
+
+
+def get_answer_cache():
+    """Return the process-wide semantic answer cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache()
+    return _cache
@@ -1,18 +1,31 @@
 import streamlit as st
-from model import get_response
-from pdf_model import process_documents, get_retriever, ask_question
-from image import encode_image, analyze_image
-from voice import get_voice_system
+from chat_store import HISTORY_PAGE_SIZE, get_chat_store
 from PIL import Image
 from about_me import show_about_me_sidebar
 from dotenv import load_dotenv
 import os
-import json
+import sys
+import importlib
+import io
+import base64
+import hashlib
 import time
+import uuid
 
 # Load environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Number of most recent messages drawn on each rerun ("Load older" widens it)
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "30"))
+THUMBNAIL_SIZE = 320
+
+# Subsystems each mode needs; they are imported the first time the mode is selected
+MODE_MODULES = {
+    "💬 Text Chat": ["model"],
+    "📄 PDF Q&A": ["embeddings", "pdf_model", "pdf_extract", "retrieval", "index_registry", "ingest_jobs"],
+    "🖼️ Image Analysis": ["image", "image_batch"],
+    "🎙️ Voice Chat": ["stt", "voice"],
+}
 
 # Page Config
 st.set_page_config(
@@ -80,33 +93,96 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
+# Each browser session keeps its own chat log; the ID lives in the URL so a reload resumes it
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+st.query_params["session"] = st.session_state.session_id
+chat_store = get_chat_store()
+
+# Initialize session state (history is loaded once per session, not on every rerun)
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = chat_store.load(st.session_state.session_id)
+    st.session_state.history_exhausted = len(st.session_state.messages) < HISTORY_PAGE_SIZE
+if "chat_window" not in st.session_state:
+    st.session_state.chat_window = CHAT_WINDOW
+if "html_fragments" not in st.session_state:
+    st.session_state.html_fragments = {}
 if "uploaded_image" not in st.session_state:
     st.session_state.uploaded_image = None
-if "pdf_processed" not in st.session_state:
-    st.session_state.pdf_processed = False
-if "voice_system" not in st.session_state:
-    st.session_state.voice_system = get_voice_system()
+# PDF collection this session searches (kept in the URL, so a bookmark returns to a user's or project's documents)
+if "collection" not in st.session_state:
+    st.session_state.collection = st.query_params.get("collection", "")
 if "listening" not in st.session_state:
     st.session_state.listening = False
 
-# Function to load chat history from JSON file
-def load_chat_history():
-    if os.path.exists("chat_history.json"):
-        with open("chat_history.json", "r") as file:
-            chat_history = json.load(file)
-            return chat_history
-    return []
-
-# Function to save chat history to a JSON file
-def save_chat_history(messages):
-    with open("chat_history.json", "w") as file:
-        json.dump(messages, file)
-
-# Load chat history at the start
-st.session_state.messages = load_chat_history()
+# Seconds spent importing each lazily loaded module (shared by all sessions)
+@st.cache_resource
+def import_profile():
+    return {}
+
+# Function to import the modules a mode needs on first use, timing each import
+def load_modules(names):
+    profile = import_profile()
+    for name in names:
+        if name not in sys.modules:
+            start = time.perf_counter()
+            importlib.import_module(name)
+            profile[name] = time.perf_counter() - start
+            print(f"Imported {name} in {profile[name]:.2f}s")
+
+# Function to add a message to the chat and append it to this session's log
+def add_message(role, content):
+    message = {"role": role, "content": content}
+    message["seq"] = chat_store.append(st.session_state.session_id, message)
+    st.session_state.messages.append(message)
+
+# Function to build the HTML of a text message, reusing it once rendered
+def message_html(message):
+    html = st.session_state.html_fragments.get(message.get("seq"))
+    if html is None:
+        role = "user" if message["role"] == "user" else "bot"
+        html = f"<div class='{role}'>{message['content']}</div>"
+        if message.get("seq") is not None:
+            st.session_state.html_fragments[message["seq"]] = html
+    return html
+
+# Function to make a small PNG thumbnail of an image message, cached by content hash
+@st.cache_data(max_entries=256, show_spinner=False)
+def image_thumbnail(digest, _content):
+    try:
+        if isinstance(_content, str) and _content.startswith("data:"):
+            source = io.BytesIO(base64.b64decode(_content.split(",", 1)[1]))
+        elif isinstance(_content, bytes):
+            source = io.BytesIO(_content)
+        else:
+            source = _content
+        image = Image.open(source)
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    except Exception:
+        # URLs and unreadable images are shown as they are
+        return _content
+
+# Function to draw an image message from its cached thumbnail
+def render_image_message(message):
+    if "digest" not in message:
+        content = message["content"]
+        message["digest"] = hashlib.sha256(content if isinstance(content, bytes) else str(content).encode()).hexdigest()
+    st.image(image_thumbnail(message["digest"], message["content"]), caption='Uploaded Image')
+
+# Function to render a streamed bot reply incrementally and return the full text
+def render_stream(chunks, container):
+    with container:
+        placeholder = st.empty()
+    placeholder.markdown("<div class='bot'>…</div>", unsafe_allow_html=True)
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        placeholder.markdown(f"<div class='bot'>{text}▌</div>", unsafe_allow_html=True)
+    placeholder.markdown(f"<div class='bot'>{text}</div>", unsafe_allow_html=True)
+    return text
 
 # Sidebar Navigation
 with st.sidebar:
@@ -120,6 +196,7 @@ with st.sidebar:
         key="mode_selector",
         help="Select the interaction mode"
     )
+    load_modules(MODE_MODULES[mode])
 
     # Settings section
     st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
@@ -129,18 +206,82 @@ with st.sidebar:
         0.0, 1.0, 0.7,
         help="Higher values produce more creative responses"
     )
+    answer_cache = sys.modules["answer_cache"].get_answer_cache().stats() if "answer_cache" in sys.modules else {"hit_rate": None}
+    if answer_cache["hit_rate"] is not None:
+        st.caption(
+            f"Answer cache: {answer_cache['hit_rate']:.0%} hit rate "
+            f"({answer_cache['hits']} hits, {answer_cache['misses']} misses, {answer_cache['entries']} entries)"
+        )
+    if mode == "💬 Text Chat":
+        from model import stream_response, get_memory
+        memory = get_memory(st.session_state.session_id).stats()
+        if memory["last_prompt_tokens"] is not None:
+            st.caption(
+                f"Last prompt: {memory['last_prompt_tokens']} tokens · {memory['turns']} recent turns, "
+                f"summary {memory['summary_tokens']} tokens"
+            )
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Clear chat history button
     if st.button("Clear Chat History"):
         st.session_state.messages = []  # Clear chat history
-        save_chat_history(st.session_state.messages)  # Save the empty chat history to file
+        st.session_state.html_fragments = {}
+        st.session_state.chat_window = CHAT_WINDOW
+        st.session_state.history_exhausted = True
+        chat_store.clear(st.session_state.session_id)  # Hide this session's saved messages
+        if "model" in sys.modules:
+            sys.modules["model"].clear_memory(st.session_state.session_id)  # Start the conversation memory afresh
         st.success("Chat history cleared!")
 
     # Mode-specific controls
     if mode == "📄 PDF Q&A":
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
         st.markdown("### 📄 PDF Options")
+        from pdf_model import remove_documents, list_documents, get_retriever, stream_answer
+        from ingest_jobs import ACTIVE_STATES, get_ingest_queue
+        from embeddings import warm_up_embeddings, embedding_stats
+        from pdf_extract import PDF_WORKERS
+        from retrieval import RERANK_ENABLED
+        from vector_store import DEFAULT_COLLECTION, collection_dir, list_collections
+        from index_registry import get_index_registry
+        # Start loading the shared embedding model the first time any session opens PDF mode
+        warm_up_embeddings()
+
+        def create_collection():
+            name = st.session_state.new_collection.strip()
+            try:
+                collection_dir(name)
+            except ValueError as e:
+                st.session_state.collection_error = str(e)
+                return
+            st.session_state.collection = name
+            st.session_state.new_collection = ""
+
+        if not st.session_state.collection:
+            st.session_state.collection = DEFAULT_COLLECTION
+        try:
+            # The name may come from a hand-edited ?collection= link
+            collection_dir(st.session_state.collection)
+        except ValueError as e:
+            st.error(f"Invalid collection '{st.session_state.collection}': {e}. Showing '{DEFAULT_COLLECTION}' instead.")
+            st.session_state.collection = DEFAULT_COLLECTION
+        collections = sorted(set(list_collections()) | {st.session_state.collection})
+        collection = st.selectbox(
+            "Collection",
+            collections,
+            index=collections.index(st.session_state.collection),
+            help="Each collection (e.g. per user or per project) has its own documents and search index"
+        )
+        st.text_input(
+            "New collection",
+            key="new_collection",
+            placeholder="e.g. a project or user name",
+            on_change=create_collection
+        )
+        if st.session_state.get("collection_error"):
+            st.error(st.session_state.pop("collection_error"))
+        st.session_state.collection = collection
+        st.query_params["collection"] = collection
         uploaded_files = st.file_uploader(
             "Upload PDFs",
             type=["pdf"],
@@ -148,109 +289,293 @@ with st.sidebar:
             key="pdf_uploader",
             help="Upload one or more PDF documents"
         )
+        pdf_workers = st.number_input(
+            "Extraction workers",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=PDF_WORKERS,
+            help="Number of processes used to extract text from PDFs in parallel"
+        )
+        rerank = st.checkbox(
+            "Rerank results",
+            value=RERANK_ENABLED,
+            help="Rerank retrieved passages with a cross-encoder (skipped automatically under load)"
+        )
+        ingest_queue = get_ingest_queue()
         if uploaded_files:
-            if st.button("Process PDFs", help="Extract text and create search index"):
-                with st.spinner("Processing PDFs..."):
-                    try:
-                        vector_store = process_documents({f.name: f for f in uploaded_files})
-                        st.session_state.retriever = get_retriever()
-                        st.session_state.pdf_processed = True
-                        st.success("PDFs processed successfully!")
-                    except Exception as e:
-                        st.error(f"Failed to process PDFs: {str(e)}")
+            if st.button("Process PDFs", help="Extract text and update the search index in the background"):
+                try:
+                    ingest_queue.submit(collection, {f.name: f.getvalue() for f in uploaded_files}, workers=pdf_workers)
+                except (OSError, ValueError) as e:
+                    st.error(f"Failed to queue PDFs: {str(e)}")
+
+        # Jobs run in the background; poll their progress while any is active
+        def show_ingest_jobs():
+            jobs = ingest_queue.store.jobs(collection, limit=5)
+            for job in jobs:
+                if job["status"] not in ACTIVE_STATES:
+                    continue
+                st.session_state.watched_jobs.add(job["id"])
+                files_done = sum(entry["status"] == "processed" for entry in job["files"])
+                fraction = job["pages_done"] / job["pages_total"] if job["pages_total"] else 0.0
+                st.progress(
+                    min(fraction, 1.0),
+                    text=f"{job['status'].capitalize()} · files {files_done}/{len(job['files'])} · "
+                         f"pages {job['pages_done']}/{job['pages_total']} · chunks indexed {job['chunks_indexed']}"
+                )
+                with st.expander("Files"):
+                    for entry in job["files"]:
+                        st.caption(f"{entry['name']}: {entry['status']}")
+                if job["cancel_requested"]:
+                    st.caption("Cancelling...")
+                elif st.button("Cancel", key=f"cancel_ingest_{job['id']}"):
+                    ingest_queue.cancel(job["id"])
+            finished = [
+                job for job in jobs
+                if job["id"] in st.session_state.watched_jobs and job["status"] not in ACTIVE_STATES
+            ]
+            if finished:
+                for job in finished:
+                    st.session_state.watched_jobs.discard(job["id"])
+                st.session_state.ingest_notices = [(job["status"], job["error"]) for job in finished]
+                # Pick up the new index version and document list everywhere on the page
+                st.rerun()
+
+        if "watched_jobs" not in st.session_state:
+            st.session_state.watched_jobs = set()
+        for status, error in st.session_state.pop("ingest_notices", []):
+            if status == "done":
+                st.success("PDFs processed successfully!")
+            elif status == "cancelled":
+                st.info("PDF processing cancelled; the index was left unchanged.")
+            else:
+                st.error(f"Failed to process PDFs: {error}")
+        active = any(job["status"] in ACTIVE_STATES for job in ingest_queue.store.jobs(collection, limit=5))
+        st.fragment(show_ingest_jobs, run_every=1.0 if active else None)()
+        indexed = list_documents(collection)
+        if indexed:
+            to_remove = st.multiselect(
+                "Indexed documents",
+                indexed,
+                key="pdf_remove_selector",
+                help="Select documents to remove from the search index"
+            )
+            if to_remove and st.button("Remove Selected PDFs"):
+                remove_documents(to_remove, collection)
+                st.success(f"Removed {len(to_remove)} document(s) from the index")
+        stats = embedding_stats()
+        if stats["loaded"]:
+            memory = f", {stats['memory_mb']:.0f} MB" if stats["memory_mb"] is not None else ""
+            st.caption(f"Embedding model loaded in {stats['load_seconds']:.1f}s{memory}")
+        if stats["chunks_per_second"]:
+            st.caption(f"Embedding throughput: {stats['chunks_per_second']:.0f} chunks/s")
+        cache = stats.get("cache")
+        if cache and cache["hit_rate"] is not None:
+            st.caption(f"Embedding cache hit rate: {cache['hit_rate']:.0%} ({cache['hits']} hits, {cache['misses']} misses)")
+        registry = get_index_registry().stats()
+        if registry["loaded"]:
+            st.caption(
+                f"Loaded indexes: {len(registry['loaded'])} collection(s), "
+                f"{registry['loaded_mb']:.0f} of {registry['budget_mb']:.0f} MB"
+            )
         st.markdown('</div>', unsafe_allow_html=True)
 
     elif mode == "🖼️ Image Analysis":
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
         st.markdown("### 🖼️ Image Options")
-        uploaded_image = st.file_uploader(
-            "Upload Image",
-            type=["jpg", "jpeg", "png"],
-            key="image_uploader",
-            help="Upload an image for analysis"
+        from image import encode_image, stream_image_analysis
+        from image_batch import (
+            BATCH_WORKERS, IMAGE_BATCH_ROOT, IMAGE_EXTENSIONS, export_results, folder_images, job_id_for, run_batch
+        )
+        batch_mode = st.toggle(
+            "Batch mode",
+            key="image_batch_mode",
+            help="Ask the same question about many images at once"
         )
-        if uploaded_image:
-            image = Image.open(uploaded_image)
-            st.session_state.uploaded_image = encode_image(uploaded_image)
-            st.image(image, caption='Uploaded Image', use_column_width=True)
+        if batch_mode:
+            batch_files = st.file_uploader(
+                "Upload Images",
+                type=[extension.lstrip(".") for extension in IMAGE_EXTENSIONS],
+                accept_multiple_files=True,
+                key="batch_image_uploader",
+                help="Upload the images to analyze"
+            )
+            batch_folder = None
+            if IMAGE_BATCH_ROOT:
+                batch_folder = st.text_input(
+                    "Or image folder on the server",
+                    key="batch_image_folder",
+                    help=f"A folder inside {IMAGE_BATCH_ROOT}; every image in it is analyzed instead of the uploads"
+                )
+            batch_workers = st.number_input(
+                "Concurrent requests",
+                min_value=1,
+                max_value=32,
+                value=BATCH_WORKERS,
+                help="Images decoded, preprocessed and analyzed at the same time"
+            )
+        else:
+            uploaded_image = st.file_uploader(
+                "Upload Image",
+                type=["jpg", "jpeg", "png"],
+                key="image_uploader",
+                help="Upload an image for analysis"
+            )
+            if uploaded_image:
+                image = Image.open(uploaded_image)
+                st.session_state.uploaded_image = encode_image(uploaded_image)
+                st.image(image, caption='Uploaded Image', use_column_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
     elif mode == "🎙️ Voice Chat":
         st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
         st.markdown("### 🎙️ Voice Settings")
+        from voice import get_voice_system
+        from stt import STT_BACKEND, STT_BACKENDS
+        # Only sessions that open Voice Chat pay for a recognizer
+        if "voice_system" not in st.session_state:
+            st.session_state.voice_system = get_voice_system()
         auto_play = st.checkbox(
             "Auto-play responses",
             value=True,
             help="Automatically speak AI responses"
         )
+        st.session_state.voice_system.backend_name = st.selectbox(
+            "Speech recognition",
+            list(STT_BACKENDS),
+            index=list(STT_BACKENDS).index(STT_BACKEND),
+            help="google sends audio to Google's service; vosk runs locally and shows words as you speak"
+        )
+        audio_file = st.file_uploader(
+            "Or upload a recording",
+            type=["wav", "aiff", "aif", "flac"],
+            key="voice_file_uploader",
+            help="Transcribe a recorded question instead of using the microphone"
+        )
         st.markdown('</div>', unsafe_allow_html=True)
 
+    # Import-time profile of the subsystems loaded so far in this server process
+    profile = import_profile()
+    if profile:
+        with st.expander("⏱️ Import profile"):
+            for name, seconds in sorted(profile.items(), key=lambda item: -item[1]):
+                st.caption(f"{name}: {seconds:.2f}s")
+
 # Main Content Area
 st.markdown("<h1 style='text-align: center; margin-bottom: 30px;'>🤖 LM DigiMind Q&A</h1>",
             unsafe_allow_html=True)
 
-# Display chat history
+# Display chat history (only the most recent window, so reruns cost the same however long the chat is)
 chat_container = st.container()
 with chat_container:
-    for message in st.session_state.messages:
-        role = "user" if message["role"] == "user" else "bot"
+    messages = st.session_state.messages
+    visible = messages[-st.session_state.chat_window:]
+    if messages and (len(visible) < len(messages) or not st.session_state.history_exhausted):
+        if st.button("⬆️ Load older messages", key="load_older"):
+            if len(visible) == len(messages):
+                older = chat_store.load(st.session_state.session_id, before_seq=messages[0]["seq"])
+                st.session_state.history_exhausted = len(older) < HISTORY_PAGE_SIZE
+                st.session_state.messages = older + messages
+            st.session_state.chat_window += CHAT_WINDOW
+            st.rerun()
+
+    # Consecutive text messages are drawn as one markdown element
+    fragments = []
+    for message in visible:
         if message.get("type") == "image":
-            st.image(message["content"], caption='Uploaded Image', use_column_width=True)
+            if fragments:
+                st.markdown("\n".join(fragments), unsafe_allow_html=True)
+                fragments = []
+            render_image_message(message)
         else:
-            st.markdown(f"<div class='{role}'>{message['content']}</div>", unsafe_allow_html=True)
+            fragments.append(message_html(message))
+    if fragments:
+        st.markdown("\n".join(fragments), unsafe_allow_html=True)
 
 # Handle different modes
 if mode == "💬 Text Chat":
     user_input = st.chat_input("Type your message here...", key="chat_input")
     if user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        add_message("user", user_input)
         with chat_container:
             st.markdown(f"<div class='user'>{user_input}</div>", unsafe_allow_html=True)
 
-        with st.spinner("Thinking..."):
-            response = get_response(user_input)
-            st.session_state.messages.append({"role": "bot", "content": response})
-            with chat_container:
-                st.markdown(f"<div class='bot'>{response}</div>", unsafe_allow_html=True)
-
-        # Save chat history after every interaction
-        save_chat_history(st.session_state.messages)
+        response = render_stream(stream_response(user_input, st.session_state.session_id), chat_container)
+        add_message("bot", response)
 
 elif mode == "📄 PDF Q&A":
-    if st.session_state.get('pdf_processed', False):
-        question = st.chat_input("Ask about the PDFs...", key="pdf_question")
+    if indexed:
+        question = st.chat_input(f"Ask about the PDFs in '{collection}'...", key="pdf_question")
         if question:
-            st.session_state.messages.append({"role": "user", "content": question})
+            add_message("user", question)
             with chat_container:
                 st.markdown(f"<div class='user'>{question}</div>", unsafe_allow_html=True)
 
-            with st.spinner("Searching documents and generating answer..."):
-                answer = ask_question(question, st.session_state.retriever)
-                st.session_state.messages.append({"role": "bot", "content": answer})
-                with chat_container:
-                    st.markdown(f"<div class='bot'>{answer}</div>", unsafe_allow_html=True)
-
-            # Save chat history after every interaction
-            save_chat_history(st.session_state.messages)
+            # Cheap to build: the index is shared through the registry
+            retriever = get_retriever(collection, rerank=rerank)
+            if retriever is None:
+                st.error("The search index could not be loaded. Please process the PDFs again.")
+            else:
+                answer = render_stream(stream_answer(question, retriever), chat_container)
+                add_message("bot", answer)
+    else:
+        st.info(f"The '{collection}' collection has no documents yet. Please upload and process PDF files using the sidebar options.")
+
+elif mode == "🖼️ Image Analysis" and batch_mode:
+    batch_images = [(f.name, f) for f in batch_files or []]
+    if batch_folder:
+        try:
+            batch_images = folder_images(batch_folder)
+        except (OSError, ValueError) as e:
+            st.error(str(e))
+    if batch_images:
+        batch_question = st.text_input("Question for every image", key="batch_question")
+        if batch_question and st.button(f"Analyze {len(batch_images)} images", type="primary"):
+            job_id = job_id_for(batch_question, batch_images)
+            progress_bar = st.progress(0.0, text="Analyzing images...")
+            table = st.empty()
+            rows = []
+            for result in run_batch(batch_images, batch_question, workers=batch_workers):
+                rows.append(result)
+                progress_bar.progress(
+                    min(len(rows) / len(batch_images), 1.0),
+                    text=f"{len(rows)} analyzed in this run · {sum(1 for row in rows if row['error'])} failed"
+                )
+                table.dataframe(rows[-200:], use_container_width=True)
+            progress_bar.progress(1.0, text="Batch complete")
+            st.session_state.batch_job_id = job_id
+        if st.session_state.get("batch_job_id"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button(
+                    "Download CSV",
+                    export_results(st.session_state.batch_job_id, "csv"),
+                    file_name=f"image_batch_{st.session_state.batch_job_id}.csv",
+                    mime="text/csv"
+                )
+            with col2:
+                st.download_button(
+                    "Download JSONL",
+                    export_results(st.session_state.batch_job_id, "jsonl"),
+                    file_name=f"image_batch_{st.session_state.batch_job_id}.jsonl",
+                    mime="application/jsonl"
+                )
     else:
-        st.info("Please upload and process PDF files first using the sidebar options.")
+        st.info("Upload images or enter an image folder in the sidebar to run a batch.")
 
 elif mode == "🖼️ Image Analysis":
     if st.session_state.uploaded_image:
         question = st.chat_input("Ask about the image...", key="image_question")
         if question:
-            st.session_state.messages.append({"role": "user", "content": question})
+            add_message("user", question)
             with chat_container:
                 st.markdown(f"<div class='user'>{question}</div>", unsafe_allow_html=True)
 
-            with st.spinner("Analyzing image..."):
-                response = analyze_image(st.session_state.uploaded_image, question)
-                st.session_state.messages.append({"role": "bot", "content": response})
-                with chat_container:
-                    st.markdown(f"<div class='bot'>{response}</div>", unsafe_allow_html=True)
-
-            # Save chat history after every interaction
-            save_chat_history(st.session_state.messages)
+            response = render_stream(
+                stream_image_analysis(st.session_state.uploaded_image, question),
+                chat_container
+            )
+            add_message("bot", response)
     else:
         st.info("Please upload an image first using the sidebar options.")
 
@@ -271,52 +596,72 @@ elif mode == "🎙️ Voice Chat":
             disabled=not st.session_state.messages or st.session_state.messages[-1]["role"] != "bot"
         )
 
-    if voice_btn:
-        with st.spinner("Listening... Speak now"):
+    transcribe_btn = audio_file is not None and st.button("📝 Ask From Recording", key="voice_file_btn")
+
+    if voice_btn or transcribe_btn:
+        partial_placeholder = st.empty()
+
+        def show_partial(text):
+            partial_placeholder.markdown(f"<div class='user'>{text}…</div>", unsafe_allow_html=True)
+
+        with st.spinner("Listening... Speak now" if voice_btn else "Transcribing recording..."):
             st.session_state.listening = True
-            user_input = st.session_state.voice_system.listen()
+            if voice_btn:
+                user_input = st.session_state.voice_system.listen(on_partial=show_partial)
+            else:
+                user_input = st.session_state.voice_system.transcribe_file(audio_file, on_partial=show_partial)
             st.session_state.listening = False
+            partial_placeholder.empty()
 
-            if user_input and user_input not in ["Could not understand audio", "Error with speech recognition service"]:
-                st.session_state.messages.append({"role": "user", "content": user_input})
+            if not st.session_state.voice_system.is_error(user_input):
+                add_message("user", user_input)
                 with chat_container:
                     st.markdown(f"<div class='user'>{user_input}</div>", unsafe_allow_html=True)
 
-                with st.spinner("Thinking..."):
-                    response = st.session_state.voice_system.voice_chat(user_input)
-                    st.session_state.messages.append({"role": "bot", "content": response})
-                    with chat_container:
-                        st.markdown(f"<div class='bot'>{response}</div>", unsafe_allow_html=True)
-
-                    if auto_play:
-                        st.session_state.voice_system.speak(response)
-                
-                # Save chat history after every interaction
-                save_chat_history(st.session_state.messages)
+                reply = st.session_state.voice_system.stream_voice_chat(user_input)
+                if auto_play:
+                    # Speak each sentence as soon as it has been streamed
+                    reply = st.session_state.voice_system.speak_stream(reply)
+                response = render_stream(reply, chat_container)
+                add_message("bot", response)
             else:
                 st.error(user_input)
 
     if play_btn and st.session_state.messages and st.session_state.messages[-1]["role"] == "bot":
         st.session_state.voice_system.speak(st.session_state.messages[-1]["content"])
 
+    if st.session_state.voice_system.speaking and st.button("⏹️ Stop Speaking", key="stop_speaking_btn"):
+        st.session_state.voice_system.stop_speaking()
+
     user_input = st.chat_input("Or type your message here...", key="voice_chat_input")
     if user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        add_message("user", user_input)
         with chat_container:
             st.markdown(f"<div class='user'>{user_input}</div>", unsafe_allow_html=True)
 
-        with st.spinner("Thinking..."):
-            response = st.session_state.voice_system.voice_chat(user_input)
-            st.session_state.messages.append({"role": "bot", "content": response})
-            with chat_container:
-                st.markdown(f"<div class='bot'>{response}</div>", unsafe_allow_html=True)
-
-            if auto_play:
-                st.session_state.voice_system.speak(response)
-        
-        # Save chat history after every interaction
-        save_chat_history(st.session_state.messages)
-
+        reply = st.session_state.voice_system.stream_voice_chat(user_input)
+        if auto_play:
+            # Speak each sentence as soon as it has been streamed
+            reply = st.session_state.voice_system.speak_stream(reply)
+        response = render_stream(reply, chat_container)
+        add_message("bot", response)
+
+
+# Latency dashboard over the recent request traces (see tracing.py)
+with st.expander("📊 Latency dashboard"):
+    from tracing import TRACE_PATH, latency_summary
+    rows = latency_summary()
+    if rows:
+        request_types = sorted({row["request"] for row in rows})
+        shown = st.selectbox("Request type", ["All"] + request_types, key="latency_request")
+        st.dataframe(
+            [row for row in rows if shown == "All" or row["request"] == shown],
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"Percentiles in ms over the most recent traces; full records in {TRACE_PATH}")
+    else:
+        st.caption("No requests traced yet.")
 
 # Add footer
 st.markdown("---")
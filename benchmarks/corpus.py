@@ -0,0 +1,83 @@
+"""Synthetic PDF corpus for ingestion and retrieval benchmarks
+
+Writes minimal, valid text PDFs with no PDF library, so corpora of any size
+can be generated reproducibly from a seed.
+"""
+import os
+import random
+
+TOPICS = [
+    "battery", "turbine", "inspection", "corrosion", "sensor", "pipeline", "voltage", "bearing",
+    "calibration", "firmware", "thermal", "vibration", "coolant", "gearbox", "welding", "hydraulic",
+]
+FILLER = (
+    "the report describes how the team measured and recorded each value during the field visit "
+    "and compared it with the expected range before deciding on maintenance"
+).split()
+LINES_PER_PAGE = 40
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a PDF whose pages each show the given list of text lines"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 760 Td {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def synthetic_page(rng, document, page):
+    """Lines of one page; every page mentions a document/page code so questions have exact answers"""
+    topic = rng.choice(TOPICS)
+    lines = [f"Document {document} page {page}: {topic} report, reference code D{document}P{page}."]
+    while len(lines) < LINES_PER_PAGE:
+        words = [rng.choice(FILLER) for _ in range(12)]
+        words[rng.randrange(12)] = rng.choice(TOPICS)
+        lines.append(" ".join(words) + ".")
+    return lines
+
+
+def generate_corpus(directory, documents, pages_per_document, seed=0, start=0):
+    """Write documents start..start+documents-1 as PDFs and return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for document in range(start, start + documents):
+        rng = random.Random(seed * 1000003 + document)
+        path = os.path.join(directory, f"doc_{document:05d}.pdf")
+        write_pdf(path, [synthetic_page(rng, document, page) for page in range(pages_per_document)])
+        paths.append(path)
+    return paths
+
+
+def sample_questions(documents, pages_per_document, count, seed=0):
+    """Questions whose answers sit on a known page of the corpus"""
+    rng = random.Random(seed)
+    return [
+        f"What is the topic of the report with reference code D{rng.randrange(documents)}P{rng.randrange(pages_per_document)}?"
+        for _ in range(count)
+    ]
@@ -0,0 +1,104 @@
+"""Recall-vs-latency benchmark of the approximate index types against the flat index
+
+Usage:
+    python benchmarks/index_recall.py                              # synthetic vectors
+    python benchmarks/index_recall.py --index faiss_index/default  # vectors of a saved collection
+    python benchmarks/index_recall.py --nprobe 4 8 16 --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_store import build_index, configure_search, factory_string, load_store  # noqa: E402
+
+
+def synthetic_vectors(count, dim, seed=0):
+    """Clustered, normalized vectors roughly shaped like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(count // 200, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)]
+    vectors += 0.3 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def saved_vectors(directory):
+    index = load_store(None, directory).index
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def measure(index, queries, k, truth=None):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    result = {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "size_mb": faiss.serialize_index(index).nbytes / (1024 * 1024),
+    }
+    if truth is not None:
+        hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+        result["recall"] = hits / (len(queries) * k)
+    return result, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", help="directory of a saved index to take vectors from")
+    parser.add_argument("--count", type=int, default=100000, help="number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=384, help="size of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["ivf", "hnsw", "pq"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    vectors = saved_vectors(args.index) if args.index else synthetic_vectors(args.count, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    flat = build_index("flat", vectors)
+    flat_result, truth = measure(flat, queries, args.k)
+    flat_result.update(type="flat", factory="Flat", build_s=0.0, recall=1.0)
+    rows = [flat_result]
+
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = build_index(index_type, vectors)
+        build_seconds = time.perf_counter() - start
+        settings = args.nprobe if index_type in ("ivf", "pq") else [None]
+        for nprobe in settings:
+            configure_search(index, nprobe)
+            result, _ = measure(index, queries, args.k, truth)
+            result.update(
+                type=index_type,
+                factory=factory_string(index_type, vectors.shape[1], len(vectors)),
+                build_s=build_seconds,
+                nprobe=nprobe,
+            )
+            rows.append(result)
+
+    print(f"{len(vectors)} vectors of size {vectors.shape[1]}, {len(queries)} queries, recall@{args.k}")
+    print(f"{'type':<6} {'factory':<16} {'nprobe':>6} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'MB':>8} {'build s':>8}")
+    for row in rows:
+        print(
+            f"{row['type']:<6} {row['factory']:<16} {row.get('nprobe') or '-':>6} {row['recall']:>7.3f} "
+            f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['size_mb']:>8.1f} {row['build_s']:>8.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
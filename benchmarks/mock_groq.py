@@ -0,0 +1,160 @@
+"""Local stand-in for the Groq chat-completions API, for offline benchmarks
+
+Usage:
+    python benchmarks/mock_groq.py --port 8765 --ttft-ms 300 --token-ms 20 --error-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "the system answers questions about documents images and speech using retrieved context".split()
+
+
+class MockGroqServer(ThreadingHTTPServer):
+    """Serves /chat/completions with configurable latency, reply length and error rates
+
+    ttft_ms is the delay before the first token (or the whole response when
+    not streaming), token_ms the delay between streamed tokens. error_rate
+    of requests get a 503 and rate_limit_rate a 429, both with Retry-After.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, ttft_ms=200, token_ms=10, tokens=60, error_rate=0.0, rate_limit_rate=0.0, seed=0):
+        super().__init__(address, MockGroqHandler)
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self):
+        """Decide the fate of one request: None, 'error' or 'rate_limited'"""
+        with self.lock:
+            self.counts["requests"] += 1
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.counts["errors"] += 1
+                return "error"
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return "rate_limited"
+            return None
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        server = self.server
+        outcome = server.draw()
+        if outcome == "error":
+            self._send_json(503, {"error": {"message": "mock overload"}}, [("Retry-After", "0.1")])
+            return
+        if outcome == "rate_limited":
+            self._send_json(429, {"error": {"message": "mock rate limit"}}, [("Retry-After", "0.2")])
+            return
+
+        model = request.get("model", "mock")
+        words = [WORDS[i % len(WORDS)] for i in range(server.tokens)]
+        prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        headers = [
+            ("x-ratelimit-remaining-requests", "14000"),
+            ("x-ratelimit-remaining-tokens", "100000"),
+            ("x-ratelimit-reset-requests", "1s"),
+            ("x-ratelimit-reset-tokens", "1s"),
+        ]
+        time.sleep(server.ttft_ms / 1000)
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            }, headers)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(server.token_ms / 1000)
+            self._send_event({
+                "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            })
+        self._send_event({
+            "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "mock", "usage": usage},
+        })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def start_mock_server(port=0, **settings):
+    """Start a mock server in a daemon thread and return it (its address is server.url)"""
+    server = MockGroqServer(("127.0.0.1", port), **settings)
+    threading.Thread(target=server.serve_forever, name="mock-groq", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockGroqServer(
+        ("127.0.0.1", args.port), ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate
+    )
+    print(f"Mock Groq API listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Offline benchmark suite: ingestion, retrieval and end-to-end latency against a local Groq stand-in
+
+Usage:
+    python benchmarks/suite.py                                    # all sections, JSON in benchmarks/results/
+    python benchmarks/suite.py --sections llm --sessions 1 4 16 --error-rate 0.05
+    python benchmarks/suite.py --corpus-sizes 10 50 200 --pages 20 --json results.json
+
+Everything runs in a scratch working directory, so the index, caches and
+chat history of a real installation are never touched. The answer cache is
+disabled unless --answer-cache is given, so every request reaches the mock.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from corpus import generate_corpus, sample_questions  # noqa: E402
+from mock_groq import start_mock_server  # noqa: E402
+
+# Replies the app shows instead of an answer when a request fails
+ERROR_PREFIXES = ("Error", "API Error", "The request timed out", "Sorry")
+
+
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "max_ms": float(np.max(values)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_ingestion(corpus_dir, sizes, pages, queries):
+    """Ingest a growing synthetic corpus; after each step time retriever load and retrieval"""
+    import pdf_model
+    from embeddings import embedding_stats, get_embeddings
+
+    get_embeddings()
+    rows = []
+    retriever = None
+    indexed = 0
+    for size in sorted(sizes):
+        paths = generate_corpus(corpus_dir, size - indexed, pages, start=indexed)
+        files = {os.path.basename(path): open(path, "rb") for path in paths}
+        stats = {}
+        start = time.perf_counter()
+        try:
+            pdf_model.process_documents(files, progress=stats.update)
+        finally:
+            for f in files.values():
+                f.close()
+        ingest_seconds = time.perf_counter() - start
+        indexed = size
+
+        start = time.perf_counter()
+        retriever = pdf_model.get_retriever()
+        load_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        for question in sample_questions(size, pages, queries):
+            start = time.perf_counter()
+            retriever.invoke(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        row = {
+            "documents": size,
+            "pages": size * pages,
+            "new_pages": stats.get("pages_done", 0),
+            "new_chunks": stats.get("chunks_indexed", 0),
+            "ingest_s": ingest_seconds,
+            "pages_per_s": stats.get("pages_done", 0) / ingest_seconds if ingest_seconds else None,
+            "chunks_per_s": stats.get("chunks_indexed", 0) / ingest_seconds if ingest_seconds else None,
+            "retriever_load_ms": load_ms,
+            "retrieval": percentiles(latencies),
+        }
+        rows.append(row)
+        print(
+            f"ingestion  {size:>5} docs: {row['ingest_s']:.1f}s for {row['new_pages']} new pages, "
+            f"retriever load {load_ms:.0f} ms, retrieval p95 {row['retrieval']['p95_ms']:.1f} ms"
+        )
+    return {"embedding_load_s": embedding_stats()["load_seconds"], "steps": rows}, retriever
+
+
+def run_sessions(stream, sessions, requests_per_session):
+    """Run stream(session, request) from concurrent sessions, timing first chunk and full reply"""
+    def session(number):
+        samples = []
+        for request in range(requests_per_session):
+            start = time.perf_counter()
+            first = None
+            text = ""
+            for chunk in stream(number, request):
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+                text += chunk
+            samples.append((first, (time.perf_counter() - start) * 1000, text.startswith(ERROR_PREFIXES)))
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        samples = [sample for result in pool.map(session, range(sessions)) for sample in result]
+    elapsed = time.perf_counter() - start
+    ok = [sample for sample in samples if not sample[2]]
+    return {
+        "sessions": sessions,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "requests_per_s": len(samples) / elapsed,
+        "ttft": percentiles([first for first, _, _ in ok if first is not None]),
+        "total": percentiles([total for _, total, _ in ok]),
+    }
+
+
+def bench_llm(session_counts, requests_per_session, retriever, pages, documents):
+    """End-to-end latency of the text, PDF and image modes under concurrent sessions"""
+    import image
+    import model
+    import pdf_model
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray((rng.random((1200, 1600, 3)) * 255).astype(np.uint8)).save(buffer, format="PNG")
+    photo = buffer.getvalue()
+    start = time.perf_counter()
+    encoded = image.encode_image(photo)
+    preprocess_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    image.encode_image(photo)
+    cached_preprocess_ms = (time.perf_counter() - start) * 1000
+
+    modes = {
+        "text": lambda session, request: model.stream_response(
+            f"Tell me fact number {request} about maintenance", session_id=f"benchmark-{session}"
+        ),
+        "image": lambda session, request: image.stream_image_analysis(encoded, f"Describe detail {request}"),
+    }
+    if retriever is not None:
+        questions = sample_questions(documents, pages, 64)
+        modes["pdf"] = lambda session, request: pdf_model.stream_answer(
+            questions[(session * requests_per_session + request) % len(questions)], retriever
+        )
+
+    rows = []
+    for mode, stream in modes.items():
+        for sessions in session_counts:
+            row = run_sessions(stream, sessions, requests_per_session)
+            row["mode"] = mode
+            rows.append(row)
+            print(
+                f"{mode:<6} {sessions:>3} sessions: ttft p95 {row['ttft']['p95_ms'] or 0:.0f} ms, "
+                f"total p95 {row['total']['p95_ms'] or 0:.0f} ms, {row['requests_per_s']:.1f} req/s, "
+                f"{row['errors']} errors"
+            )
+    return {
+        "image_preprocess_ms": preprocess_ms,
+        "image_preprocess_cached_ms": cached_preprocess_ms,
+        "image_payload_kb": len(encoded) * 3 / 4 / 1024,
+        "runs": rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", nargs="+", choices=["ingestion", "llm"], default=["ingestion", "llm"])
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[5, 20, 50], help="documents, cumulative")
+    parser.add_argument("--pages", type=int, default=10, help="pages per synthetic document")
+    parser.add_argument("--queries", type=int, default=50, help="retrieval queries per corpus size")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="concurrent sessions")
+    parser.add_argument("--requests", type=int, default=5, help="requests per session")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="mock time to first token")
+    parser.add_argument("--token-ms", type=float, default=10, help="mock delay between tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="mock reply length in tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of mock requests failing with 429")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache enabled")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--json", help="results file (default: benchmarks/results/benchmark-<time>.json)")
+    args = parser.parse_args()
+
+    mock = start_mock_server(
+        ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate
+    )
+    os.environ["GROQ_BASE_URL"] = mock.url
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    if args.answer_cache:
+        os.environ.setdefault("TEXT_ANSWER_CACHE", "1")
+    else:
+        os.environ["ANSWER_CACHE_THRESHOLD"] = "2"  # no similarity reaches this
+    output = os.path.abspath(args.json or os.path.join(
+        REPO_DIR, "benchmarks", "results", f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    ))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="thesis-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workdir": workdir,
+            "settings": vars(args),
+        }
+    }
+    retriever = None
+    if "ingestion" in args.sections:
+        results["ingestion"], retriever = bench_ingestion(
+            os.path.join(workdir, "corpus"), args.corpus_sizes, args.pages, args.queries
+        )
+    if "llm" in args.sections:
+        results["llm"] = bench_llm(args.sessions, args.requests, retriever, args.pages, max(args.corpus_sizes))
+    results["mock"] = dict(mock.counts)
+    mock.shutdown()
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+
+CHAT_DB_PATH = os.getenv("CHAT_DB_PATH", "chat_history.db")
+# Messages loaded per page when a session opens or scrolls back
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("CHAT_COMPACTION_INTERVAL", "300"))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class ChatStore:
+    """Append-only chat log per session in SQLite (WAL mode)
+
+    Each message is a single-row insert, so saving costs the same however
+    long the conversation is. Clearing a session only records a marker;
+    cleared messages are deleted later by the background compaction.
+    """
+
+    def __init__(self, path=CHAT_DB_PATH):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                type TEXT,
+                content TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                cleared_seq INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+    def _last_seq(self, session_id):
+        row = self.conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(seq) FROM messages WHERE session_id = :id), 0), "
+            "COALESCE((SELECT cleared_seq FROM sessions WHERE session_id = :id), 0))",
+            {"id": session_id}
+        ).fetchone()
+        return row[0]
+
+    def append(self, session_id, message):
+        """Append one message and return its sequence number"""
+        with self._lock:
+            seq = self._last_seq(session_id) + 1
+            self.conn.execute(
+                "INSERT INTO messages (session_id, seq, role, type, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, message["role"], message.get("type"), message["content"], time.time())
+            )
+            self.conn.commit()
+        return seq
+
+    def load(self, session_id, limit=HISTORY_PAGE_SIZE, before_seq=None):
+        """Up to limit messages older than before_seq (default: the newest), oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT seq, role, type, content FROM messages "
+                "WHERE session_id = ? AND seq < ? "
+                "AND seq > COALESCE((SELECT cleared_seq FROM sessions WHERE session_id = ?), 0) "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq if before_seq is not None else 2 ** 62, session_id, limit)
+            ).fetchall()
+        messages = []
+        for seq, role, message_type, content in reversed(rows):
+            message = {"role": role, "content": content, "seq": seq}
+            if message_type:
+                message["type"] = message_type
+            messages.append(message)
+        return messages
+
+    def clear(self, session_id):
+        """Hide all of a session's messages; compaction deletes them later"""
+        with self._lock:
+            last_seq = self._last_seq(session_id)
+            self.conn.execute(
+                "INSERT INTO sessions (session_id, cleared_seq) VALUES (?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET cleared_seq = excluded.cleared_seq",
+                (session_id, last_seq)
+            )
+            self.conn.commit()
+
+    def compact(self):
+        """Delete cleared messages and fold the WAL back into the database file"""
+        with self._lock:
+            deleted = self.conn.execute(
+                "DELETE FROM messages WHERE seq <= "
+                "COALESCE((SELECT cleared_seq FROM sessions WHERE sessions.session_id = messages.session_id), 0)"
+            ).rowcount
+            self.conn.commit()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def start_compaction(self, interval=COMPACTION_INTERVAL_SECONDS):
+        """Run compact() every interval seconds in a daemon thread"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.compact()
+                except sqlite3.Error as e:
+                    print(f"Chat history compaction failed: {e}")
+
+        threading.Thread(target=run, name="chat-compaction", daemon=True).start()
+
+
+def get_chat_store():
+    """Return the process-wide chat store, starting its background compaction"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ChatStore()
+                _store.start_compaction()
+    return _store
@@ -0,0 +1,260 @@
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from tracing import record_span, resident_memory_mb
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", "512"))
+# Sentences per forward pass, and torch intra-op threads (0 keeps torch's default)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+
+# One embedding engine per process, shared by every Streamlit session
+_engine = None
+_engine_lock = threading.Lock()
+_warm_up_thread = None
+_cache = None
+_stats = {
+    "load_seconds": None,
+    "memory_mb": None,
+    "documents_embedded": 0,
+    "queries_embedded": 0,
+    "embed_seconds": 0.0,
+}
+
+
+class SharedEmbeddings(Embeddings):
+    """Thread-safe wrapper around the process-wide HuggingFace model"""
+
+    def __init__(self, model, batch_size=EMBED_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def _token_lengths(self, texts):
+        """Token count of each text, falling back to character count"""
+        try:
+            encoded = self.model.client.tokenizer(texts, add_special_tokens=False)
+            return [len(ids) for ids in encoded["input_ids"]]
+        except Exception:
+            return [len(text) for text in texts]
+
+    def embed_array(self, texts):
+        """Embed texts into a contiguous (len(texts), dim) float32 array
+
+        Texts are sorted by token length so each batch pads to a similar
+        length, embedded in batches of batch_size, and returned in input order.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Same preprocessing as HuggingFaceEmbeddings, so vectors match embed_query
+        texts = [text.replace("\n", " ") for text in texts]
+        order = np.argsort(self._token_lengths(texts), kind="stable")
+        with self._lock:
+            start = time.perf_counter()
+            sorted_vectors = self.model.client.encode(
+                [texts[i] for i in order],
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                **{k: v for k, v in self.model.encode_kwargs.items() if k != "batch_size"}
+            )
+            elapsed = time.perf_counter() - start
+            _stats["documents_embedded"] += len(texts)
+            _stats["embed_seconds"] += elapsed
+        vectors = np.empty_like(sorted_vectors, dtype=np.float32)
+        vectors[order] = sorted_vectors
+        return np.ascontiguousarray(vectors)
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        with self._lock:
+            vector = self.model.embed_query(text)
+            _stats["queries_embedded"] += 1
+        record_span("embed_query", start, chars=len(text))
+        return vector
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk store of float32 vectors with size-bounded LRU eviction
+
+    Each vector lives in its own .npy file named after the hash of its key and
+    is read back memory-mapped. File modification times track recency.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npy")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".npy"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Return the cached vector for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            vector = np.array(np.load(path, mmap_mode="r"), dtype=np.float32)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return vector
+
+    def put(self, key, vector):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.asarray(vector, dtype=np.float32))
+        os.replace(temp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least recently used vectors until the cache is 90% full"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "size_mb": self._size / (1024 * 1024),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that reuse vectors from the on-disk cache for unchanged chunks"""
+
+    def __init__(self, engine, cache, namespace):
+        self.engine = engine
+        self.cache = cache
+        self.namespace = namespace
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_array(self, texts):
+        """Embed texts into a float32 array, computing only the cache misses"""
+        keys = [self._key(text) for text in texts]
+        cached = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        computed = self.engine.embed_array([texts[i] for i in missing]) if missing else None
+        for i, vector in zip(missing, computed if computed is not None else []):
+            self.cache.put(keys[i], vector)
+            cached[i] = vector
+        if not cached:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.ascontiguousarray(np.stack(cached), dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.engine.embed_query(text)
+
+
+def get_embedding_cache():
+    """Return the process-wide on-disk embedding cache"""
+    global _cache
+    with _engine_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MB * 1024 * 1024)
+    return _cache
+
+
+def get_cached_embeddings(settings):
+    """Shared engine behind the embedding cache, keyed by model name and splitter settings"""
+    namespace = f"{EMBEDDING_MODEL}|{settings}"
+    return CachedEmbeddings(get_embeddings(), get_embedding_cache(), namespace)
+
+
+def get_embeddings():
+    """Return the shared embedding engine, loading the model on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                # Imported here: it pulls in sentence-transformers, which only this load needs
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                memory_before = resident_memory_mb()
+                start = time.perf_counter()
+                model = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL,
+                    model_kwargs={"device": "cpu"}
+                )
+                _stats["load_seconds"] = time.perf_counter() - start
+                memory_after = resident_memory_mb()
+                if memory_before is not None and memory_after is not None:
+                    _stats["memory_mb"] = memory_after - memory_before
+                if EMBED_THREADS:
+                    import torch
+                    torch.set_num_threads(EMBED_THREADS)
+                print(f"Loaded embedding model {EMBEDDING_MODEL} in {_stats['load_seconds']:.2f}s")
+                _engine = SharedEmbeddings(model)
+    return _engine
+
+
+def embeddings_loaded():
+    """Whether the embedding model has already been loaded in this process"""
+    return _engine is not None
+
+
+def warm_up_embeddings():
+    """Start loading the embedding model in the background (no-op after the first call)"""
+    global _warm_up_thread
+    with _engine_lock:
+        if _engine is not None or _warm_up_thread is not None:
+            return
+        _warm_up_thread = threading.Thread(target=get_embeddings, name="embedding-warm-up", daemon=True)
+        _warm_up_thread.start()
+
+
+def embedding_stats():
+    """Load time, memory cost and usage counters of the shared embedding engine"""
+    stats = {"model": EMBEDDING_MODEL, "loaded": _engine is not None, **_stats}
+    stats["chunks_per_second"] = (
+        _stats["documents_embedded"] / _stats["embed_seconds"] if _stats["embed_seconds"] else None
+    )
+    if _cache is not None:
+        stats["cache"] = _cache.stats()
+    return stats
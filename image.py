@@ -1,71 +1,155 @@
-from groq import Groq
 from groq import APITimeoutError, APIError
 import base64
+import hashlib
 import os
-from PIL import Image
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
 from io import BytesIO
 from dotenv import load_dotenv
 import time
+from streaming import timed_stream
+from llm_client import stream_chat
+from tracing import annotate, record_error, trace
 
 # Load environment variables
 load_dotenv()
 
+# Longest side sent to the vision model; larger photos are downscaled first
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1120"))
+# Encoded payload size to aim for, and the format used (JPEG or WEBP)
+IMAGE_TARGET_KB = int(os.getenv("IMAGE_TARGET_KB", "300"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+# Encoded images kept in memory, keyed by a hash of the original file
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "64"))
+IMAGE_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png", "GIF": "image/gif"}
+_QUALITIES = (90, 80, 70, 60, 50)
+
+_encoded = OrderedDict()
+_encoded_lock = threading.Lock()
+
+
+def _read_bytes(uploaded_image):
+    if isinstance(uploaded_image, (bytes, bytearray)):
+        return bytes(uploaded_image)
+    if isinstance(uploaded_image, str):
+        with open(uploaded_image, "rb") as f:
+            return f.read()
+    if hasattr(uploaded_image, "getvalue"):
+        return uploaded_image.getvalue()
+    uploaded_image.seek(0)
+    return uploaded_image.read()
+
+
+def preprocess_image(data, max_side=IMAGE_MAX_SIDE, target_kb=IMAGE_TARGET_KB, image_format=IMAGE_FORMAT):
+    """Downscale an image and re-encode it to roughly target_kb, returning (bytes, mime type)
+
+    Quality is lowered step by step until the payload fits; if even the
+    lowest quality is too large the image is shrunk further.
+    """
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode not in ("RGB", "L"):
+        # JPEG has no alpha channel, so flatten transparent images onto white
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    target_bytes = target_kb * 1024
+    while True:
+        for quality in _QUALITIES:
+            buffered = BytesIO()
+            image.save(buffered, format=image_format, quality=quality)
+            if buffered.tell() <= target_bytes:
+                return buffered.getvalue(), _MIME_TYPES[image_format]
+        if max(image.size) <= 256:
+            return buffered.getvalue(), _MIME_TYPES[image_format]
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.LANCZOS)
+
+
 def encode_image(uploaded_image):
-    """Convert uploaded image to base64 string with error handling"""
+    """Preprocess an uploaded image and return it as a base64 data URL (cached by content hash)"""
     try:
-        image = Image.open(uploaded_image)
-        buffered = BytesIO()
-        image_format = image.format if image.format else 'JPEG'
-        image.save(buffered, format=image_format)
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        data = _read_bytes(uploaded_image)
+        key = hashlib.sha256(data).hexdigest()
+        with _encoded_lock:
+            if key in _encoded:
+                _encoded.move_to_end(key)
+                return _encoded[key]
+
+        with trace("image_preprocess", input_bytes=len(data)):
+            payload, mime_type = preprocess_image(data)
+            data_url = f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}"
+            annotate(payload_bytes=len(payload), mime_type=mime_type)
+        with _encoded_lock:
+            _encoded[key] = data_url
+            while len(_encoded) > IMAGE_CACHE_SIZE:
+                _encoded.popitem(last=False)
+        return data_url
     except Exception as e:
         print(f"Error encoding image: {str(e)}")
         raise Exception("Failed to process the image. Please check the file and try again.")
 
-def analyze_image(base64_image, question):
-    """Send image and question to Groq API for analysis with retry mechanism"""
-    max_retries = 3
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
-        try:
-            client = Groq(
-                api_key=os.getenv("GROQ_API_KEY"),
-                timeout=30  # Set timeout for the client
-            )
 
-            messages = [
+def _data_url(base64_image):
+    """Data URL for an encoded image; bare base64 gets its mime type from the file signature"""
+    if base64_image.startswith("data:"):
+        return base64_image
+    header = base64.b64decode(base64_image[:24] + "=" * (-len(base64_image[:24]) % 4))
+    if header.startswith(b"\x89PNG"):
+        mime_type = "image/png"
+    elif header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        mime_type = "image/webp"
+    elif header.startswith(b"GIF8"):
+        mime_type = "image/gif"
+    else:
+        mime_type = "image/jpeg"
+    return f"data:{mime_type};base64,{base64_image}"
+
+
+def image_messages(base64_image, question):
+    """Chat messages asking question about one encoded image"""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": question},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                            },
-                        },
-                    ],
-                }
-            ]
-
-            response = client.chat.completions.create(
-                messages=messages,
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
+                    "type": "image_url",
+                    "image_url": {
+                        "url": _data_url(base64_image),
+                    },
+                },
+            ],
+        }
+    ]
+
+def stream_image_analysis(base64_image, question):
+    """Stream the Groq API's analysis of an image as it is generated (retries follow the shared policy)"""
+    start = time.perf_counter()
+    with trace("image", image_chars=len(base64_image), question_chars=len(question)):
+        try:
+            response = stream_chat(
+                image_messages(base64_image, question),
+                IMAGE_MODEL,
                 timeout=25  # Set timeout for the request
             )
 
-            return response.choices[0].message.content
-            
-        except APITimeoutError:
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                continue
-            return "The request timed out. Please try again later."
+            yield from timed_stream(response, "image", start)
+
+        except APITimeoutError as e:
+            record_error(e)
+            yield "The request timed out. Please try again later."
         except APIError as e:
-            return f"API Error: {str(e)}"
+            record_error(e)
+            yield f"API Error: {str(e)}"
         except Exception as e:
-            if attempt == max_retries - 1:  # Only return error on last attempt
-                return f"Error analyzing image: {str(e)}"
-    
-    return "Sorry, I couldn't analyze the image after multiple attempts."
\ No newline at end of file
+            record_error(e)
+            yield f"Error analyzing image: {str(e)}"
+
+def analyze_image(base64_image, question):
+    """Send image and question to Groq API for analysis"""
+    return "".join(stream_image_analysis(base64_image, question))
@@ -0,0 +1,222 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from image import IMAGE_MODEL, encode_image, image_messages
+from llm_client import complete
+
+IMAGE_JOBS_PATH = os.getenv("IMAGE_JOBS_PATH", "image_jobs.db")
+# Images decoded, preprocessed and sent to the API at the same time
+BATCH_WORKERS = int(os.getenv("IMAGE_BATCH_WORKERS", "4"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Server folder that batch jobs may read images from ("" allows uploads only)
+IMAGE_BATCH_ROOT = os.getenv("IMAGE_BATCH_ROOT", "")
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def _content_hash(source):
+    """sha256 of an image given as a path, bytes or a file-like object"""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    elif isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    elif hasattr(source, "getvalue"):
+        digest.update(source.getvalue())
+    else:
+        source.seek(0)
+        digest.update(source.read())
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def image_keys(images):
+    """Key of each (name, source) image: its name plus a hash of its content
+
+    Two uploads that share a file name get different keys, so neither one's
+    result stands in for the other's.
+    """
+    return [f"{name}\0{_content_hash(source)}" for name, source in images]
+
+
+def job_id_for(question, images, keys=None):
+    """Stable job ID, so re-running the same question over the same images resumes the job
+
+    images is a list of (name, source) pairs; the key covers each image's
+    content, so different images that share file names start a new job.
+    """
+    entries = sorted(keys or image_keys(images))
+    key = question + "\0" + "\0".join(entries)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def folder_images(folder):
+    """(name, path) pairs of the images directly inside folder, sorted by name
+
+    folder is relative to IMAGE_BATCH_ROOT; a ValueError is raised for
+    anything outside it, so visitors can't read arbitrary server paths.
+    """
+    if not IMAGE_BATCH_ROOT:
+        raise ValueError("Image folders on the server are disabled.")
+    root = os.path.realpath(IMAGE_BATCH_ROOT)
+    path = os.path.realpath(os.path.join(root, folder))
+    inside = os.path.commonpath([root, path]) == root
+    if os.path.isabs(folder) or ".." in folder.replace("\\", "/").split("/") or not inside:
+        raise ValueError(f"'{folder}' is not a folder inside {IMAGE_BATCH_ROOT}.")
+    if not os.path.isdir(path):
+        raise ValueError(f"Folder '{folder}' does not exist.")
+    return [
+        (name, os.path.join(path, name))
+        for name in sorted(os.listdir(path))
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+class ImageJobStore:
+    """Persistent record of batch jobs and their per-image results (SQLite, WAL mode)"""
+
+    def __init__(self, path=IMAGE_JOBS_PATH):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+        if columns and "image_key" not in columns:
+            # Results keyed by file name alone, from job IDs no current job can resume
+            self.conn.execute("DROP TABLE results")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                created REAL NOT NULL,
+                finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                job_id TEXT NOT NULL,
+                image_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                answer TEXT,
+                error TEXT,
+                seconds REAL,
+                PRIMARY KEY (job_id, image_key)
+            );
+        """)
+
+    def start(self, job_id, question, total):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, question, total, created) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET total = excluded.total, finished = NULL",
+                (job_id, question, total, time.time())
+            )
+            self.conn.commit()
+
+    def finish(self, job_id):
+        with self._lock:
+            self.conn.execute("UPDATE jobs SET finished = ? WHERE id = ?", (time.time(), job_id))
+            self.conn.commit()
+
+    def done_keys(self, job_id):
+        """Image keys of the job that already have an answer (failed ones are retried on resume)"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT image_key FROM results WHERE job_id = ? AND error IS NULL", (job_id,)
+            ).fetchall()
+        return {image_key for image_key, in rows}
+
+    def record(self, job_id, image_key, result):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (job_id, image_key, name, answer, error, seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, image_key, result["name"], result["answer"], result["error"], result["seconds"])
+            )
+            self.conn.commit()
+
+    def results(self, job_id):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT name, answer, error, seconds FROM results WHERE job_id = ? ORDER BY name, image_key", (job_id,)
+            ).fetchall()
+        return [dict(zip(("name", "answer", "error", "seconds"), row)) for row in rows]
+
+
+def get_job_store():
+    """Return the process-wide batch job store"""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = ImageJobStore()
+    return _jobs
+
+
+def _analyze(name, source, question):
+    start = time.perf_counter()
+    try:
+        answer = complete(image_messages(encode_image(source), question), IMAGE_MODEL, timeout=25)
+        return {"name": name, "answer": answer, "error": None, "seconds": time.perf_counter() - start}
+    except Exception as e:
+        return {"name": name, "answer": None, "error": str(e), "seconds": time.perf_counter() - start}
+
+
+def run_batch(images, question, workers=BATCH_WORKERS):
+    """Ask question about every image, yielding result dicts as they complete
+
+    images is a list of (name, source) pairs, where source is a path, bytes
+    or a file-like object. Results are recorded as they arrive, so running
+    the same question over the same images again skips the ones already
+    answered. At most two images per worker are in flight at once.
+    """
+    store = get_job_store()
+    keys = image_keys(images)
+    job_id = job_id_for(question, images, keys)
+    store.start(job_id, question, len(images))
+    done = store.done_keys(job_id)
+    pending = iter([(key, image) for key, image in zip(keys, images) if key not in done])
+    if done:
+        print(f"Resuming image batch {job_id}: {len(done)} of {len(images)} already answered")
+
+    start = time.perf_counter()
+    completed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-batch") as pool:
+        running = {}
+        while True:
+            while len(running) < workers * 2:
+                task = next(pending, None)
+                if task is None:
+                    break
+                key, (name, source) = task
+                running[pool.submit(_analyze, name, source, question)] = key
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                store.record(job_id, running.pop(future), result)
+                completed += 1
+                yield result
+    store.finish(job_id)
+    if completed:
+        elapsed = time.perf_counter() - start
+        print(f"Image batch {job_id}: {completed} images in {elapsed:.1f}s ({completed / elapsed:.1f} images/s)")
+
+
+def export_results(job_id, file_format="csv"):
+    """Results of a job as CSV or JSONL text"""
+    results = get_job_store().results(job_id)
+    if file_format == "jsonl":
+        return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["name", "answer", "error", "seconds"])
+    writer.writeheader()
+    writer.writerows(results)
+    return buffer.getvalue()
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from embeddings import get_embeddings
+from vector_store import DEFAULT_COLLECTION, collection_dir, load_store
+
+# Memory budget for the collection indexes kept loaded, shared by every session
+INDEX_CACHE_MB = int(os.getenv("INDEX_CACHE_MB", "1024"))
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class IndexRegistry:
+    """Process-wide LRU of loaded collection indexes
+
+    Every session searching a collection shares one memory-mapped copy of
+    its index. A collection is reloaded on the next request once a newer
+    generation has been saved (documents added or removed), and the least
+    recently used collections are dropped when the loaded indexes exceed the
+    memory budget; they are loaded again on demand. Sessions still holding a
+    dropped store keep using it until their request finishes.
+    """
+
+    def __init__(self, budget_mb=INDEX_CACHE_MB):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per collection, so loading one index doesn't hold up searches of the others
+        self._load_locks = {}
+        self._stats = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0, "load_seconds": 0.0}
+
+    def get(self, collection=DEFAULT_COLLECTION):
+        """The loaded store of a collection; raises FileNotFoundError if it has no index yet"""
+        with self._lock:
+            store = self._current(collection)
+            if store is not None:
+                return store
+            load_lock = self._load_locks.setdefault(collection, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                # Another session may have loaded it while this one waited
+                store = self._current(collection)
+                if store is not None:
+                    return store
+                reload = collection in self._stores
+            start = time.perf_counter()
+            store = load_store(get_embeddings(), collection_dir(collection), mmap=True)
+            with self._lock:
+                self._stats["reloads" if reload else "loads"] += 1
+                self._stats["load_seconds"] += time.perf_counter() - start
+                self._stores[collection] = store
+                self._stores.move_to_end(collection)
+                self._evict()
+            return store
+
+    def _current(self, collection):
+        """The loaded store of a collection if it is the latest generation, else None"""
+        store = self._stores.get(collection)
+        if store is None or store.docstore.generation() != store.generation:
+            return None
+        self._stores.move_to_end(collection)
+        self._stats["hits"] += 1
+        return store
+
+    def _evict(self):
+        """Drop least recently used stores beyond the budget, always keeping the newest"""
+        while len(self._stores) > 1 and self.loaded_bytes() > self.budget_bytes:
+            collection, _ = self._stores.popitem(last=False)
+            self._stats["evictions"] += 1
+            print(f"Unloaded index of collection '{collection}' (index memory budget {self.budget_bytes / (1024 * 1024):.0f} MB)")
+
+    def loaded_bytes(self):
+        return sum(store.size_bytes for store in self._stores.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "loaded": list(self._stores),
+                "loaded_mb": self.loaded_bytes() / (1024 * 1024),
+                "budget_mb": self.budget_bytes / (1024 * 1024),
+            }
+
+
+def get_index_registry():
+    """Return the process-wide index registry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry()
+    return _registry
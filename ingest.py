@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+import time
+from pdf_extract import extract_pdfs
+
+# Chunks embedded and added to the index per batch (sorted by length within a batch)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# Maximum number of items waiting between two pipeline stages
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+
+_END = object()
+
+
+class IngestCancelled(Exception):
+    """Raised by a progress callback to stop an ingestion; the caller discards the partial index"""
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def _threaded(items, stop, heartbeat=None):
+    """Run a generator stage in a background thread behind a bounded queue
+
+    Yields the stage's items in order. If heartbeat is set, None is yielded
+    whenever nothing arrives for that many seconds, so the consumer can
+    report progress while upstream stages are busy.
+    """
+    buffer = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageError(e))
+        else:
+            put(_END)
+
+    threading.Thread(target=run, name="ingest-stage", daemon=True).start()
+    # Stopped stages don't send _END, so poll and give up once stop is set
+    while not stop.is_set():
+        try:
+            item = buffer.get(timeout=heartbeat or 0.1)
+        except queue.Empty:
+            if heartbeat is not None:
+                yield None
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+def _split_pages(files, splitter, workers, stats):
+    """Stage 1: extracted pages -> chunks"""
+    def progress(done, total):
+        stats["pages_done"], stats["pages_total"] = done, total
+
+    for doc_id, pages, finished in extract_pdfs(files, workers=workers, progress=progress):
+        stats["extract_ms"] += sum(page.metadata["extract_seconds"] for page in pages) * 1000
+        start = time.perf_counter()
+        chunks = splitter.split_documents(pages)
+        stats["split_ms"] += (time.perf_counter() - start) * 1000
+        stats["chunks_split"] += len(chunks)
+        if chunks:
+            yield "chunks", doc_id, chunks
+        if finished:
+            yield "done", doc_id, None
+
+
+def _embed_batches(messages, embeddings, batch_size, stats):
+    """Stage 2: chunks -> batches of (chunks, vectors), flushed per document"""
+    pending = {}
+
+    def embed(chunks):
+        start = time.perf_counter()
+        vectors = embeddings.embed_array([chunk.page_content for chunk in chunks])
+        stats["embed_ms"] += (time.perf_counter() - start) * 1000
+        stats["chunks_embedded"] += len(chunks)
+        return chunks, vectors
+
+    for kind, doc_id, chunks in messages:
+        if kind == "chunks":
+            batch = pending.setdefault(doc_id, [])
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield "chunks", doc_id, embed(batch[:batch_size])
+                del batch[:batch_size]
+        else:
+            if pending.get(doc_id):
+                yield "chunks", doc_id, embed(pending[doc_id])
+            pending.pop(doc_id, None)
+            yield "done", doc_id, None
+
+
+def ingest(index, files, splitter, embeddings, workers=None, progress=None, on_document=None):
+    """Stream PDFs into the index: pages -> chunks -> embedded batches -> index adds
+
+    files is a list of (doc_id, path, digest) tuples. Stages run concurrently
+    with bounded queues between them, so peak memory depends on batch and
+    queue sizes rather than on corpus size. progress, if given, is called on
+    the caller's thread with a dict of stage counters; the *_ms counters are
+    the busy time of each stage (extraction summed over worker processes).
+    on_document, if given, is called with each doc_id once all its chunks
+    are in the index. embeddings must provide embed_array (see embeddings.py).
+    """
+    stats = {
+        "pages_done": 0,
+        "pages_total": 0,
+        "chunks_split": 0,
+        "chunks_embedded": 0,
+        "chunks_indexed": 0,
+        "extract_ms": 0.0,
+        "split_ms": 0.0,
+        "embed_ms": 0.0,
+        "index_ms": 0.0,
+    }
+    digests = {doc_id: digest for doc_id, _, digest in files}
+    started = set()
+    stop = threading.Event()
+
+    def begin(doc_id):
+        if doc_id not in started:
+            index.begin_document(doc_id, digests[doc_id])
+            started.add(doc_id)
+
+    try:
+        chunks = _threaded(_split_pages([(doc_id, path) for doc_id, path, _ in files], splitter, workers, stats), stop)
+        batches = _threaded(_embed_batches(chunks, embeddings, INGEST_BATCH_SIZE, stats), stop, heartbeat=0.5)
+        for message in batches:
+            if message is not None:
+                kind, doc_id, batch = message
+                begin(doc_id)
+                if kind == "chunks":
+                    start = time.perf_counter()
+                    index.add_chunks(doc_id, *batch)
+                    stats["index_ms"] += (time.perf_counter() - start) * 1000
+                    stats["chunks_indexed"] += len(batch[0])
+                elif on_document:
+                    on_document(doc_id)
+            if progress:
+                progress(dict(stats))
+    finally:
+        stop.set()
+    return stats
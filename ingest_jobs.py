@@ -0,0 +1,276 @@
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from ingest import IngestCancelled
+from pdf_model import process_documents
+from vector_store import collection_dir
+
+INGEST_JOBS_PATH = os.getenv("INGEST_JOBS_PATH", "ingest_jobs.db")
+# Uploaded PDFs are kept here until their job ends, so queued and running jobs survive a restart
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "ingest_uploads")
+# Jobs processed at the same time (each one already extracts PDFs with a process pool)
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))
+# Seconds between progress writes to the job record
+PROGRESS_INTERVAL = 0.5
+ACTIVE_STATES = ("queued", "running")
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class IngestJobStore:
+    """Persistent record of ingestion jobs and the state of each of their files (SQLite, WAL mode)"""
+
+    def __init__(self, path=INGEST_JOBS_PATH):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                collection TEXT NOT NULL,
+                status TEXT NOT NULL,
+                workers INTEGER,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER NOT NULL DEFAULT 0,
+                chunks_indexed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                job_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                PRIMARY KEY (job_id, name)
+            );
+        """)
+
+    def create(self, job_id, collection, workers, files):
+        """Record a queued job; files is a list of (name, path) pairs"""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, collection, status, workers, created) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, collection, workers, time.time())
+            )
+            self.conn.executemany(
+                "INSERT INTO files (job_id, name, path, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, name, path) for name, path in files]
+            )
+            self.conn.commit()
+
+    def set_status(self, job_id, status, error=None):
+        column = "started" if status == "running" else "finished"
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, {column} = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+            self.conn.commit()
+
+    def update_progress(self, job_id, stats):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET pages_done = ?, pages_total = ?, chunks_indexed = ? WHERE id = ?",
+                (stats["pages_done"], stats["pages_total"], stats["chunks_indexed"], job_id)
+            )
+            self.conn.commit()
+
+    def set_file_status(self, job_id, status, name=None, where=None):
+        """Set the status of one file, or of every file currently in status where"""
+        with self._lock:
+            if name is not None:
+                self.conn.execute("UPDATE files SET status = ? WHERE job_id = ? AND name = ?", (status, job_id, name))
+            else:
+                self.conn.execute("UPDATE files SET status = ? WHERE job_id = ? AND status = ?", (status, job_id, where))
+            self.conn.commit()
+
+    def request_cancel(self, job_id):
+        """Flag a job for cancellation; a job that hasn't started is cancelled right away"""
+        with self._lock:
+            self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            self.conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            self.conn.commit()
+
+    def cancel_requested(self, job_id):
+        with self._lock:
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def resumable(self):
+        """IDs of the jobs to run after a restart, oldest first
+
+        Jobs that were running when the process stopped start over; their
+        index changes were never committed, and the embedding cache makes
+        the repeated work cheap.
+        """
+        with self._lock:
+            self.conn.execute(
+                "UPDATE files SET status = 'pending' WHERE job_id IN (SELECT id FROM jobs WHERE status = 'running')"
+            )
+            self.conn.execute("UPDATE jobs SET status = 'queued', started = NULL WHERE status = 'running'")
+            self.conn.commit()
+            rows = self.conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()
+        return [job_id for job_id, in rows]
+
+    def _files(self, job_id):
+        rows = self.conn.execute(
+            "SELECT name, path, status FROM files WHERE job_id = ? ORDER BY name", (job_id,)
+        ).fetchall()
+        return [dict(zip(("name", "path", "status"), row)) for row in rows]
+
+    def job(self, job_id):
+        """A job record with its files, or None"""
+        return next(iter(self._select("WHERE id = ?", (job_id,))), None)
+
+    def jobs(self, collection=None, limit=10):
+        """Most recent jobs first, optionally of one collection only"""
+        if collection is None:
+            return self._select("ORDER BY created DESC LIMIT ?", (limit,))
+        return self._select("WHERE collection = ? ORDER BY created DESC LIMIT ?", (collection, limit))
+
+    def _select(self, clause, parameters):
+        columns = (
+            "id", "collection", "status", "workers", "cancel_requested", "pages_done", "pages_total",
+            "chunks_indexed", "error", "created", "started", "finished"
+        )
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM jobs {clause}", parameters).fetchall()
+            jobs = [dict(zip(columns, row)) for row in rows]
+            for job in jobs:
+                job["files"] = self._files(job["id"])
+        return jobs
+
+
+class IngestQueue:
+    """Runs PDF ingestion jobs on background threads instead of the Streamlit script thread
+
+    Uploads are written to INGEST_UPLOAD_DIR and recorded in the job store
+    before a job is queued, so a rerun or browser refresh doesn't lose
+    them and unfinished jobs start again after a restart. A job's changes
+    are committed as one new index generation when it finishes, which the
+    index registry then switches to; a cancelled or failed job leaves the
+    collection untouched.
+    """
+
+    def __init__(self, store=None, workers=INGEST_JOB_WORKERS):
+        self.store = store or IngestJobStore()
+        self._jobs = queue.Queue()
+        resumed = self.store.resumable()
+        if resumed:
+            print(f"Resuming {len(resumed)} ingestion job(s)")
+        for job_id in resumed:
+            self._jobs.put(job_id)
+        for number in range(workers):
+            threading.Thread(target=self._run, name=f"ingest-job-{number}", daemon=True).start()
+
+    def submit(self, collection, files, workers=None):
+        """Queue PDFs for a collection and return the job ID; files maps file names to their bytes"""
+        collection_dir(collection)  # raises ValueError for an invalid name
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(INGEST_UPLOAD_DIR, job_id)
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for number, (name, data) in enumerate(files.items()):
+            # Numbered, so file names from the browser never become paths
+            path = os.path.join(directory, f"{number}.pdf")
+            with open(path, "wb") as f:
+                f.write(data)
+            paths.append((name, path))
+        self.store.create(job_id, collection, workers, paths)
+        self._jobs.put(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        self.store.request_cancel(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._jobs.get()
+            try:
+                self._process(job_id)
+            except Exception as e:
+                print(f"Ingestion job {job_id} crashed: {e}")
+
+    def _process(self, job_id):
+        job = self.store.job(job_id)
+        if job is None or job["status"] != "queued":
+            # Cancelled while it was waiting
+            self._discard_files(job_id)
+            self._remove_uploads(job_id)
+            return
+        if job["cancel_requested"]:
+            # Cancelled while it was running, just before a restart
+            self.store.set_status(job_id, "cancelled")
+            self._discard_files(job_id)
+            self._remove_uploads(job_id)
+            return
+        self.store.set_status(job_id, "running")
+        last_write = [0.0]
+        latest = {}
+
+        def progress(stats):
+            latest.update(stats)
+            now = time.monotonic()
+            if now - last_write[0] >= PROGRESS_INTERVAL:
+                last_write[0] = now
+                self.store.update_progress(job_id, stats)
+                if self.store.cancel_requested(job_id):
+                    raise IngestCancelled()
+
+        def on_document(name):
+            # Its chunks are staged; they only reach the index if the job finishes
+            self.store.set_file_status(job_id, "processed", name=name)
+
+        handles = {}
+        try:
+            for entry in job["files"]:
+                handles[entry["name"]] = open(entry["path"], "rb")
+            process_documents(
+                handles, collection=job["collection"], workers=job["workers"],
+                progress=progress, on_document=on_document
+            )
+        except IngestCancelled:
+            self._discard_files(job_id)
+            self.store.set_status(job_id, "cancelled")
+            print(f"Ingestion job {job_id} cancelled")
+        except Exception as e:
+            self._discard_files(job_id)
+            self.store.set_status(job_id, "failed", error=str(e))
+        else:
+            if latest:
+                self.store.update_progress(job_id, latest)
+            # Files whose content was already indexed were skipped
+            self.store.set_file_status(job_id, "unchanged", where="pending")
+            self.store.set_status(job_id, "done")
+        finally:
+            for handle in handles.values():
+                handle.close()
+            self._remove_uploads(job_id)
+
+    def _discard_files(self, job_id):
+        """The index changes of a cancelled or failed job were rolled back, so none of its files were indexed"""
+        for status in ("processed", "pending"):
+            self.store.set_file_status(job_id, "not indexed", where=status)
+
+    def _remove_uploads(self, job_id):
+        shutil.rmtree(os.path.join(INGEST_UPLOAD_DIR, job_id), ignore_errors=True)
+
+
+def get_ingest_queue():
+    """Return the process-wide ingestion job queue, resuming unfinished jobs on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue()
+    return _queue
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import queue
+import re
+import threading
+import time
+import httpx
+from dotenv import load_dotenv
+from groq import APIStatusError, AsyncGroq, DefaultAsyncHttpxClient
+from retry import (
+    RETRY_ATTEMPTS, CircuitOpenError, backoff_delay, get_breaker, get_latency, hedge_model,
+    is_retryable, retry_after
+)
+from tracing import annotate
+
+# Load environment variables
+load_dotenv()
+
+# Requests in flight across all sessions, and pooled HTTP connections kept open
+MAX_CONCURRENT_REQUESTS = int(os.getenv("GROQ_MAX_CONCURRENT", "8"))
+MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+# Hold new requests back when fewer tokens than this remain in the current rate-limit window
+MIN_REMAINING_TOKENS = int(os.getenv("GROQ_MIN_REMAINING_TOKENS", "1000"))
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+_loop = None
+_client = None
+_limiter = None
+_setup_lock = threading.Lock()
+
+
+def parse_duration(value):
+    """Seconds in a Groq reset header such as '2m59.56s' or '120ms' (None if unparseable)"""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+class RateLimiter:
+    """Global concurrency cap plus a pause driven by Groq's rate-limit headers
+
+    After each response the x-ratelimit-remaining-* headers are checked; when
+    the request or token quota is (nearly) used up, new requests wait until
+    the matching x-ratelimit-reset-* time instead of running into 429s.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, min_remaining_tokens=MIN_REMAINING_TOKENS):
+        self.min_remaining_tokens = min_remaining_tokens
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.paused_until = 0.0
+        self.remaining = {}
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            print(f"Groq rate limit nearly reached, queuing request for {delay:.1f}s")
+            await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update(self, headers):
+        """Record the quota left after a response and pause if it ran out"""
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = int(float(remaining))
+            except ValueError:
+                continue
+            self.remaining[kind] = remaining
+            threshold = self.min_remaining_tokens if kind == "tokens" else 1
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining < threshold and reset:
+                self.pause(reset)
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def _setup():
+    """Start the event loop thread that owns the shared async client"""
+    global _loop, _client, _limiter
+    with _setup_lock:
+        if _loop is None:
+            # Built before the loop thread starts, so a failure (e.g. no API key) leaves no thread behind
+            client = AsyncGroq(
+                api_key=os.getenv("GROQ_API_KEY"),
+                base_url=os.getenv("GROQ_BASE_URL") or None,
+                max_retries=0,  # retries follow the shared policy in retry.py instead
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_CONNECTIONS
+                    )
+                )
+            )
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_loop, args=(loop,), name="groq-client", daemon=True).start()
+            _limiter = asyncio.run_coroutine_threadsafe(_make_limiter(), loop).result()
+            _client = client
+            _loop = loop
+    return _loop
+
+
+async def _make_limiter():
+    return RateLimiter()
+
+
+async def _attempt(request, items, stats):
+    """Run one streamed request, putting ("token" | "usage" | "done" | "error", value) items on items"""
+    try:
+        queued = time.monotonic()
+        async with _limiter:
+            stats["queue_ms"] += (time.monotonic() - queued) * 1000
+            raw = await _client.chat.completions.with_raw_response.create(stream=True, **request)
+            _limiter.update(raw.headers)
+            stream = await raw.parse()
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    items.put_nowait(("token", chunk.choices[0].delta.content))
+                usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+                if usage:
+                    items.put_nowait(("usage", usage))
+        items.put_nowait(("done", None))
+    except Exception as e:
+        if isinstance(e, APIStatusError) and e.status_code == 429:
+            # Hold back every other request too, not just this one
+            _limiter.pause(retry_after(e) or 1.0)
+        items.put_nowait(("error", e))
+
+
+def _launch(request, stats):
+    items = asyncio.Queue()
+    return asyncio.ensure_future(_attempt(request, items, stats)), items
+
+
+def _has_images(messages):
+    return any(
+        isinstance(message.get("content"), list)
+        and any(part.get("type") == "image_url" for part in message["content"])
+        for message in messages
+    )
+
+
+def _record_error(model, error):
+    """Count a failed request against its model's breaker; returns whether it is worth retrying"""
+    if is_retryable(error):
+        get_breaker(model).record_failure()
+        return True
+    # The service answered, so this says nothing about its health
+    get_breaker(model).record_success()
+    return False
+
+
+async def _first_item(request, stats):
+    """Start a request and wait for its first item, hedging with the fallback model if it is slow
+
+    Returns (model, task, items, first_item) for whichever request answered
+    first; the other one is cancelled. A cancelled half-open trial is
+    released, so the breaker doesn't wait for an outcome that never comes.
+    """
+    model = request["model"]
+    trials = set()
+    if get_breaker(model).check(model):
+        trials.add(0)
+    fallback = hedge_model(model, has_images=_has_images(request["messages"]))
+    timeout = get_latency(model).p95() if fallback else None
+    candidates = [(model, *_launch(request, stats))]
+    winner = None
+    getters = {asyncio.ensure_future(candidates[0][2].get()): 0}
+    try:
+        while True:
+            done, _ = await asyncio.wait(getters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                timeout = None
+                try:
+                    trial = get_breaker(fallback).check(fallback)
+                except CircuitOpenError:
+                    continue
+                print(f"No first token from {model} within its p95 latency, hedging with {fallback}")
+                candidates.append((fallback, *_launch({**request, "model": fallback}, stats)))
+                getters[asyncio.ensure_future(candidates[-1][2].get())] = len(candidates) - 1
+                if trial:
+                    trials.add(len(candidates) - 1)
+                continue
+            getter = done.pop()
+            index = getters.pop(getter)
+            item = getter.result()
+            if item[0] == "error" and getters:
+                # The other request may still succeed
+                _record_error(candidates[index][0], item[1])
+                trials.discard(index)
+                continue
+            winner = candidates[index]
+            return (*winner, item)
+    finally:
+        for getter in getters:
+            getter.cancel()
+        for index, candidate in enumerate(candidates):
+            if candidate is not winner:
+                candidate[1].cancel()
+                if index in trials:
+                    get_breaker(candidate[0]).release()
+
+
+async def _stream(out, request):
+    """Run a completion under the retry policy, passing ("token" | "usage" | "stats" | "error" | "done", value) items to out
+
+    Only failures before the first token are retried; once text has been
+    shown to the user a failure is reported as it is. A "stats" item with
+    the attempts, queueing time and serving model precedes "done" or "error".
+    """
+    task = None
+    stats = {"attempts": 0, "queue_ms": 0.0, "served_by": None}
+    try:
+        for attempt in range(RETRY_ATTEMPTS):
+            started = time.monotonic()
+            stats["attempts"] = attempt + 1
+            model, task, items, item = await _first_item(request, stats)
+            stats["served_by"] = model
+            if item[0] == "error":
+                error = item[1]
+                if not _record_error(model, error):
+                    raise error
+                if attempt == RETRY_ATTEMPTS - 1:
+                    raise error
+                delay = backoff_delay(attempt, error)
+                print(f"{model} request failed ({error.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            get_breaker(model).record_success()
+            get_latency(model).record(time.monotonic() - started)
+            while True:
+                kind, value = item
+                if kind == "token":
+                    out.put(("token", value))
+                elif kind == "usage":
+                    out.put(("usage", value))
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+                item = await items.get()
+            out.put(("stats", stats))
+            out.put(("done", None))
+            return
+    except Exception as e:
+        out.put(("stats", stats))
+        out.put(("error", e))
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+def stream_chat(messages, model, on_usage=None, **kwargs):
+    """Stream the text of a chat completion through the shared client
+
+    Blocks the calling thread between tokens only; the request itself runs
+    on the client's event loop, bounded by the global concurrency limit and
+    the rate-limit pause, and retried under the policy in retry.py. Errors
+    that outlast the retries are re-raised in the caller. on_usage,
+    if given, is called with the usage Groq reports at the end of the stream.
+    Payload size, token counts, attempts and queueing time are added to the
+    caller's trace.
+    """
+    loop = _setup()
+    out = queue.Queue()
+    request = {"messages": messages, "model": model, **kwargs}
+    annotate(model=model, request_bytes=len(json.dumps(messages)))
+    future = asyncio.run_coroutine_threadsafe(_stream(out, request), loop)
+    try:
+        while True:
+            kind, value = out.get()
+            if kind == "token":
+                yield value
+            elif kind == "usage":
+                annotate(prompt_tokens=value.prompt_tokens, completion_tokens=value.completion_tokens)
+                if on_usage:
+                    on_usage(value)
+            elif kind == "stats":
+                annotate(
+                    llm_attempts=value["attempts"], llm_queue_ms=round(value["queue_ms"], 3),
+                    served_by=value["served_by"]
+                )
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        # Stops the request if the caller abandons the stream early
+        future.cancel()
+
+
+def complete(messages, model, **kwargs):
+    """Return the full text of a chat completion"""
+    return "".join(stream_chat(messages, model, **kwargs))
+
+
+def client_stats():
+    """Concurrency limit and the last rate-limit quota seen"""
+    stats = {"max_concurrent": MAX_CONCURRENT_REQUESTS}
+    if _limiter is not None:
+        stats["remaining"] = dict(_limiter.remaining)
+        stats["paused_seconds"] = max(0.0, _limiter.paused_until - time.monotonic())
+    return stats
@@ -1,22 +1,28 @@
-from langchain.memory import ConversationBufferMemory
-from langchain import LLMChain, PromptTemplate
-from langchain_groq import ChatGroq
+from collections import OrderedDict
+from langchain_core.prompts import PromptTemplate
 from groq import NotFoundError
 import os
+import sys
+import threading
+import time
 from dotenv import load_dotenv
+from answer_cache import get_answer_cache
+from streaming import timed_stream
+from llm_client import complete, stream_chat
+from tracing import record_error, span, trace
 
 # Load environment variables
 load_dotenv()
 
-# Initialize memory
-memory = ConversationBufferMemory(input_key="human_input", memory_key="chat_history")
+# Conversation history kept verbatim per session; older turns are folded into a summary
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "500"))
+# Answer cache for text chat: "1" always, "0" never, "auto" once another mode has loaded the embedding model
+TEXT_ANSWER_CACHE = os.getenv("TEXT_ANSWER_CACHE", "auto")
 
-# Initialize LLM with default model
-llm = ChatGroq(
-    model_name="llama3-70b-8192",
-    temperature=0.7,
-    api_key=os.getenv("GROQ_API_KEY")
-)
+# Default model, called through the shared Groq client
+MODEL_NAME = "llama3-70b-8192"
+TEMPERATURE = 0.7
 
 # Define Prompt
 template = """
@@ -37,18 +43,200 @@ prompt = PromptTemplate(
     input_variables=["chat_history", "human_input"], template=template
 )
 
-# Initialize LLM Chain
-llm_chain = LLMChain(
-    llm=llm,
-    prompt=prompt,
-    memory=memory
+summary_prompt = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template="""Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary. Keep names, facts and open questions; drop small talk.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
 )
 
-def get_response(user_input):
-    """Handle text conversations with error handling"""
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+def _format_turns(turns):
+    return "\n".join(f"Human: {human}\nAI: {ai}" for human, ai in turns)
+
+
+class SessionMemory:
+    """Conversation memory of one chat session, bounded by a token budget
+
+    Recent turns are kept verbatim. When they exceed the budget the oldest
+    ones are moved to a pending list and summarized in a background thread,
+    so a reply never waits for summarization. Pending turns stay in the
+    prompt verbatim until they have been folded into the summary; if
+    summarization fails, the oldest of them are dropped beyond the budget.
+    """
+
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary = ""
+        self.turns = []
+        self.pending = []
+        self.last_prompt_tokens = None
+        self._lock = threading.Lock()
+        self._summarizing = False
+
+    def history(self):
+        """Summary plus recent turns, formatted for the prompt"""
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of the earlier conversation: {self.summary}")
+            if self.pending or self.turns:
+                parts.append(_format_turns(self.pending + self.turns))
+            return "\n".join(parts)
+
+    def save(self, human, ai):
+        """Record a turn and start summarizing whatever no longer fits the budget"""
+        with self._lock:
+            self.turns.append((human, ai))
+            while len(self.turns) > 1 and estimate_tokens(_format_turns(self.turns)) > self.token_budget:
+                self.pending.append(self.turns.pop(0))
+            if not self.pending or self._summarizing:
+                return
+            self._summarizing = True
+        threading.Thread(target=self._summarize, name="memory-summary", daemon=True).start()
+
+    def _summarize(self):
+        while True:
+            with self._lock:
+                batch = list(self.pending)
+                summary = self.summary
+                if not batch:
+                    self._summarizing = False
+                    return
+            try:
+                new_summary = complete(
+                    [{"role": "user", "content": summary_prompt.format(
+                        summary=summary or "(none)", new_lines=_format_turns(batch)
+                    )}],
+                    MODEL_NAME,
+                    temperature=TEMPERATURE
+                ).strip()
+            except Exception as e:
+                print(f"Conversation summary failed: {e}")
+                with self._lock:
+                    # Unsummarized turns stay in the prompt, so keep them within the budget too
+                    dropped = 0
+                    while self.pending and estimate_tokens(_format_turns(self.pending)) > self.token_budget:
+                        self.pending.pop(0)
+                        dropped += 1
+                    if dropped:
+                        print(f"Dropped {dropped} old conversation turn(s) that could not be summarized")
+                    self._summarizing = False
+                return
+            with self._lock:
+                self.summary = new_summary
+                del self.pending[:len(batch)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "turns": len(self.turns),
+                "pending_turns": len(self.pending),
+                "summary_tokens": estimate_tokens(self.summary),
+                "last_prompt_tokens": self.last_prompt_tokens,
+            }
+
+
+_memories = OrderedDict()
+_memories_lock = threading.Lock()
+
+
+def get_memory(session_id):
+    """Return the memory of a chat session, dropping the least recently used beyond MEMORY_MAX_SESSIONS"""
+    with _memories_lock:
+        memory = _memories.get(session_id)
+        if memory is None:
+            memory = _memories[session_id] = SessionMemory()
+            while len(_memories) > MEMORY_MAX_SESSIONS:
+                _memories.popitem(last=False)
+        else:
+            _memories.move_to_end(session_id)
+        return memory
+
+
+def clear_memory(session_id):
+    """Forget the conversation of a chat session"""
+    with _memories_lock:
+        _memories.pop(session_id, None)
+
+def stream_response(user_input, session_id="default"):
+    """Stream a text conversation reply as it is generated, with error handling"""
+    start = time.perf_counter()
+    with trace("text", question_chars=len(user_input)):
+        yield from _traced_response(user_input, session_id, start)
+
+def _use_answer_cache():
+    """Whether text replies go through the answer cache
+
+    Embedding a question needs the embedding model, which is too heavy to
+    load just for the cache; in "auto" mode text-only users never load it.
+    """
+    if TEXT_ANSWER_CACHE == "auto":
+        embeddings = sys.modules.get("embeddings")
+        return embeddings is not None and embeddings.embeddings_loaded()
+    return TEXT_ANSWER_CACHE == "1"
+
+def _traced_response(user_input, session_id, start):
+    memory = get_memory(session_id)
+    history = memory.history()
+    # Only replies that don't depend on the conversation can be shared
+    # between sessions; with history, "what's my name?" has a private answer
+    cache = get_answer_cache() if not history and _use_answer_cache() else None
+    query_vector = None
+    if cache is not None:
+        with span("answer_cache") as attributes:
+            query_vector = cache.embed(user_input)
+            cached_response = cache.lookup("text:no-history", query_vector)
+            attributes["hit"] = cached_response is not None
+        if cached_response is not None:
+            # Keep the conversation history consistent with what the user sees
+            memory.save(user_input, cached_response)
+            memory.last_prompt_tokens = 0
+            yield cached_response
+            return
+
     try:
-        return llm_chain.predict(human_input=user_input)
-    except NotFoundError:
-        return "Error: The AI service is currently unavailable. Please try again later."
+        with span("prompt") as attributes:
+            formatted_prompt = prompt.format(chat_history=history, human_input=user_input)
+            memory.last_prompt_tokens = estimate_tokens(formatted_prompt)
+            attributes.update(prompt_chars=len(formatted_prompt), prompt_tokens_estimate=memory.last_prompt_tokens)
+
+        def record_usage(usage):
+            # Exact count reported by the API with the last chunk
+            memory.last_prompt_tokens = usage.prompt_tokens
+
+        tokens = stream_chat(
+            [{"role": "user", "content": formatted_prompt}],
+            MODEL_NAME,
+            temperature=TEMPERATURE,
+            on_usage=record_usage
+        )
+        parts = []
+        for token in timed_stream(tokens, "text", start):
+            parts.append(token)
+            yield token
+        response = "".join(parts)
+        memory.save(user_input, response)
+        if cache is not None:
+            cache.store("text:no-history", user_input, query_vector, response)
+    except NotFoundError as e:
+        record_error(e)
+        yield "Error: The AI service is currently unavailable. Please try again later."
     except Exception as e:
-        return f"Error processing your request: {str(e)}"
\ No newline at end of file
+        record_error(e)
+        yield f"Error processing your request: {str(e)}"
+
+def get_response(user_input, session_id="default"):
+    """Handle text conversations with error handling"""
+    return "".join(stream_response(user_input, session_id))
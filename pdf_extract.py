@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pdfplumber
+from langchain_core.documents import Document
+
+# Number of extraction processes (defaults to one per CPU core)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+# Large PDFs are split into page ranges of this size so one file can use several cores
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# One process pool per worker count, so a call never shuts down a pool another ingestion is using
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """Return the shared extraction process pool with this many workers"""
+    with _pool_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        return _pools[workers]
+
+
+def _page_count(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(path, source, first, last):
+    """Extract the text of pages [first, last) of one PDF, timing each page"""
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        total_pages = len(pdf.pages)
+        for number in range(first, min(last, total_pages)):
+            start = time.perf_counter()
+            page = pdf.pages[number]
+            text = page.extract_text() or ""
+            page.close()
+            pages.append(Document(
+                page_content=text,
+                metadata={
+                    "source": source,
+                    "file_path": source,
+                    "page": number,
+                    "total_pages": total_pages,
+                    "extract_seconds": time.perf_counter() - start,
+                }
+            ))
+    return pages
+
+
+def extract_pdfs(files, workers=None, pages_per_task=PAGES_PER_TASK, progress=None):
+    """Extract pages from PDFs in parallel, yielding results as they finish
+
+    files is a list of (doc_id, path) pairs. Yields (doc_id, pages, finished)
+    tuples in completion order, where finished is True once every page range
+    of that document has been yielded. At most two tasks per worker are in
+    flight, so memory stays bounded however large the corpus is. progress, if
+    given, is called with (pages_done, pages_total).
+    """
+    workers = workers or PDF_WORKERS
+    tasks = []
+    total_pages = 0
+    for doc_id, path in files:
+        page_count = _page_count(path)
+        total_pages += page_count
+        for first in range(0, max(page_count, 1), pages_per_task):
+            tasks.append((doc_id, path, first, first + pages_per_task))
+    remaining = {}
+    for doc_id, *_ in tasks:
+        remaining[doc_id] = remaining.get(doc_id, 0) + 1
+
+    start = time.perf_counter()
+    page_times = []
+    if progress:
+        progress(0, total_pages)
+
+    def finish(doc_id, pages):
+        remaining[doc_id] -= 1
+        page_times.extend(page.metadata["extract_seconds"] for page in pages)
+        if progress:
+            progress(len(page_times), total_pages)
+        return doc_id, pages, remaining[doc_id] == 0
+
+    if workers <= 1 or len(tasks) <= 1:
+        # Not worth the process start-up cost
+        for doc_id, path, first, last in tasks:
+            yield finish(doc_id, extract_page_range(path, doc_id, first, last))
+    else:
+        pool = _get_pool(workers)
+        pending = iter(tasks)
+        running = {}
+        while True:
+            while len(running) < workers * 2:
+                task = next(pending, None)
+                if task is None:
+                    break
+                doc_id, path, first, last = task
+                running[pool.submit(extract_page_range, path, doc_id, first, last)] = doc_id
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finish(running.pop(future), future.result())
+
+    if page_times:
+        elapsed = time.perf_counter() - start
+        print(
+            f"Extracted {len(page_times)} pages from {len(remaining)} PDF(s) in {elapsed:.2f}s "
+            f"({len(page_times) / elapsed:.1f} pages/s, slowest page {max(page_times):.2f}s, "
+            f"{workers} worker(s))"
+        )
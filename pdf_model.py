@@ -1,88 +1,145 @@
 import os
 import tempfile
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from groq import Groq
+from vector_store import DEFAULT_COLLECTION, collection_dir, content_hash, indexed_documents, update_index
 from groq import APITimeoutError, APIError
 from dotenv import load_dotenv
+from embeddings import get_cached_embeddings
+from index_registry import get_index_registry
+from ingest import IngestCancelled, ingest
+from retrieval import HybridRetriever
+from answer_cache import get_answer_cache
+from streaming import timed_stream
+from llm_client import stream_chat
+from tracing import annotate, record_error, span, trace
 import time
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client with environment variable
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Text splitter settings (also part of the embedding cache key)
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
 
-def process_documents(uploaded_files):
-    """Process uploaded PDF files and store embeddings in FAISS vector store"""
-    try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            pdf_paths = []
-            for filename, file in uploaded_files.items():
-                path = os.path.join(temp_dir, filename)
-                with open(path, "wb") as f:
-                    f.write(file.read())
-                pdf_paths.append(path)
-
-            documents = []
-            for path in pdf_paths:
-                loader = PDFPlumberLoader(path)
-                documents.extend(loader.load())
+def _document_embeddings():
+    """Cached embeddings for PDF chunks produced with the current splitter settings"""
+    return get_cached_embeddings(f"chunk_size={CHUNK_SIZE},chunk_overlap={CHUNK_OVERLAP}")
+
+def process_documents(uploaded_files, collection=DEFAULT_COLLECTION, workers=None, progress=None, on_document=None):
+    """Add new or changed PDF files to a collection's FAISS vector store, skipping unchanged ones
 
+    PDFs (and page ranges of large PDFs) are extracted in parallel by up to
+    `workers` processes, defaulting to PDF_WORKERS, and streamed through
+    splitting and embedding into the index. progress, if given, receives the
+    ingestion stage counters and on_document each finished file name (see
+    ingest.ingest). Nothing is saved if progress raises IngestCancelled,
+    which is re-raised. Raises ValueError for an invalid collection name.
+    """
+    directory = collection_dir(collection)
+    try:
+        with trace("ingest", collection=collection, files=len(uploaded_files)), tempfile.TemporaryDirectory() as temp_dir:
             text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1200, 
-                chunk_overlap=150
+                chunk_size=CHUNK_SIZE, 
+                chunk_overlap=CHUNK_OVERLAP
             )
-            splits = text_splitter.split_documents(documents)
 
-            embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2",
-                model_kwargs={"device": "cpu"}
-            )
+            def add_changed_files(index):
+                changed = []
+                with span("hash") as attributes:
+                    upload_bytes = 0
+                    for number, (filename, file) in enumerate(uploaded_files.items()):
+                        data = file.read()
+                        upload_bytes += len(data)
+                        digest = content_hash(data)
+                        if index.is_current(filename, digest):
+                            continue
 
-            vector_store = FAISS.from_documents(
-                documents=splits,
-                embedding=embeddings
-            )
-            
-            # Save the FAISS index
-            vector_store.save_local("faiss_index")
-            return vector_store
+                        # The browser's file name is only the document ID, never part of a path
+                        path = os.path.join(temp_dir, f"{number}.pdf")
+                        with open(path, "wb") as f:
+                            f.write(data)
+                        changed.append((filename, path, digest))
+                    attributes.update(upload_bytes=upload_bytes, changed=len(changed))
+
+                with span("ingest_pipeline"):
+                    stats = ingest(
+                        index, changed, text_splitter, index.embeddings,
+                        workers=workers, progress=progress, on_document=on_document
+                    )
+                # Stage times are summed over the pipeline's threads, which overlap
+                annotate(**stats)
+                with span("train"):
+                    index.train()
+                return [filename for filename, _, _ in changed]
+
+            index, added = update_index(_document_embeddings(), add_changed_files, directory)
+            print(f"Indexed {len(added)} new or changed PDF(s): {added}")
+            return index.store
             
+    except IngestCancelled:
+        raise
     except Exception as e:
         print(f"Error processing documents: {str(e)}")
         raise Exception("Failed to process documents. Please check the files and try again.")
 
-def get_retriever():
-    """Create retriever from stored FAISS vector DB"""
+def remove_documents(doc_ids, collection=DEFAULT_COLLECTION):
+    """Remove documents from a collection's FAISS vector store by ID (their file name)"""
+    def remove(index):
+        return [doc_id for doc_id in doc_ids if index.remove_document(doc_id)]
+
+    _, removed = update_index(_document_embeddings(), remove, collection_dir(collection))
+    return removed
+
+def list_documents(collection=DEFAULT_COLLECTION):
+    """IDs of the documents currently in a collection's FAISS vector store"""
+    return indexed_documents(collection_dir(collection))
+
+def get_retriever(collection=DEFAULT_COLLECTION, rerank=None):
+    """Create a hybrid (vector + keyword) retriever over a collection's stored FAISS vector DB
+
+    The index itself comes from the shared registry, so building a retriever
+    per question is cheap. Search parameters such as nprobe are set when the
+    index is loaded (IVF_NPROBE), as every session shares it.
+    """
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={"device": "cpu"}
-        )
-        vector_store = FAISS.load_local(
-            "faiss_index", 
-            embeddings, 
-            allow_dangerous_deserialization=True
-        )
-        return vector_store.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": 3}
+        vector_store = get_index_registry().get(collection)
+        retriever = HybridRetriever(
+            store=vector_store, k=3, index_version=f"{collection}:{vector_store.generation}"
         )
+        if rerank is not None:
+            retriever.rerank = rerank
+        return retriever
     except Exception as e:
         print(f"Error initializing vector store: {e}")
         return None
 
-def ask_question(query, retriever):
-    """Ask question to the model using retrieved context with retry mechanism"""
-    max_retries = 3
-    retry_delay = 2
-    
-    for attempt in range(max_retries):
-        try:
-            docs = retriever.get_relevant_documents(query)
+def stream_answer(query, retriever):
+    """Stream an answer from the model using retrieved context (retries follow the shared policy)"""
+    start = time.perf_counter()
+    with trace("pdf", question_chars=len(query)):
+        yield from _traced_answer(query, retriever, start)
+
+def _traced_answer(query, retriever, start):
+    # Near-identical questions against the same index version reuse the answer
+    cache = get_answer_cache()
+    cache_scope = f"pdf:{getattr(retriever, 'index_version', '')}"
+    with span("answer_cache") as attributes:
+        # Embedded once: the raw vector is reused for the FAISS search below
+        query_embedding = cache.embed_query(query)
+        query_vector = cache.normalize(query_embedding)
+        cached_answer = cache.lookup(cache_scope, query_vector)
+        attributes["hit"] = cached_answer is not None
+    if cached_answer is not None:
+        yield cached_answer
+        return
+
+    parts = []
+    try:
+        with span("retrieval") as attributes:
+            docs = retriever.invoke(query, embedding=query_embedding)
+            attributes["documents"] = len(docs)
+
+        with span("prompt") as attributes:
             context = "\n\n".join([doc.page_content for doc in docs])
 
             prompt = f"""You are a helpful assistant. Use the following context to answer the user's question.
@@ -92,23 +149,29 @@ Context:
 
 Question: {query}
 Answer:"""
+            attributes.update(context_chars=len(context), prompt_chars=len(prompt))
 
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "user", "content": prompt}],
-                timeout=30
-            )
+        response = stream_chat(
+            [{"role": "user", "content": prompt}],
+            "llama-3.3-70b-versatile",
+            timeout=30
+        )
 
-            return response.choices[0].message.content
-            
-        except APITimeoutError:
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                continue
-            return "The request timed out. Please try again later."
-        except APIError as e:
-            return f"API Error: {str(e)}"
-        except Exception as e:
-            return f"Error processing your question: {str(e)}"
-    
-    return "Sorry, I couldn't process your request after multiple attempts."
\ No newline at end of file
+        for token in timed_stream(response, "pdf", start):
+            parts.append(token)
+            yield token
+        cache.store(cache_scope, query, query_vector, "".join(parts))
+
+    except APITimeoutError as e:
+        record_error(e)
+        yield "The request timed out. Please try again later."
+    except APIError as e:
+        record_error(e)
+        yield f"API Error: {str(e)}"
+    except Exception as e:
+        record_error(e)
+        yield f"Error processing your question: {str(e)}"
+
+def ask_question(query, retriever):
+    """Ask question to the model using retrieved context"""
+    return "".join(stream_answer(query, retriever))
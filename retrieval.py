@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from typing import Any
+from pydantic import ConfigDict, Field
+from tracing import record_span
+from langchain_core.retrievers import BaseRetriever
+
+# Candidates taken from each of the vector and keyword searches
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+# Fused candidates scored by the cross-encoder
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "10"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+# Retrieval latency budget; the rerank is skipped when it wouldn't fit
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "800"))
+# Reranks allowed to run at once; requests beyond that skip the stage
+RERANK_CONCURRENCY = int(os.getenv("RERANK_CONCURRENCY", "2"))
+RRF_K = 60
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+_rerank_slots = threading.BoundedSemaphore(RERANK_CONCURRENCY)
+# Moving average of recent rerank durations, used to predict the next one
+_rerank_ms = None
+
+
+def get_cross_encoder():
+    """Return the shared CPU cross-encoder, loading it on first use"""
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+                print(f"Loaded cross-encoder {RERANK_MODEL} in {time.perf_counter() - start:.2f}s")
+    return _cross_encoder
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked ID lists, scoring each ID by the sum of 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses FAISS and BM25 keyword results, optionally reranked by a cross-encoder
+
+    Keyword search catches exact tokens such as part numbers and error codes
+    that embeddings blur. The two rankings are merged with reciprocal rank
+    fusion, and the top candidates are reranked when the latency budget and
+    the number of concurrent reranks allow it.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    store: Any
+    index_version: str = ""
+    k: int = 3
+    fetch_k: int = RETRIEVAL_FETCH_K
+    rerank: bool = RERANK_ENABLED
+    rerank_top_n: int = RERANK_TOP_N
+    budget_ms: float = RETRIEVAL_BUDGET_MS
+    last_timings: dict = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query, *, run_manager=None, embedding=None):
+        """Top k chunks for query; embedding, if the caller already has it, saves embedding the query again"""
+        start = time.perf_counter()
+        timings = {}
+
+        if embedding is not None:
+            vector_hits = self.store.similarity_search_with_score_by_vector(list(embedding), k=self.fetch_k)
+        else:
+            vector_hits = self.store.similarity_search_with_score(query, k=self.fetch_k)
+        docs = {doc.id: doc for doc, _ in vector_hits}
+        vector_ranking = [doc.id for doc, _ in vector_hits]
+        timings["vector_ms"] = (time.perf_counter() - start) * 1000
+        record_span("faiss_search", start, hits=len(vector_hits))
+
+        keyword_start = time.perf_counter()
+        keyword_search = getattr(self.store.docstore, "keyword_search", None)
+        keyword_ranking = [str(chunk_id) for chunk_id in keyword_search(query, self.fetch_k)] if keyword_search else []
+        timings["keyword_ms"] = (time.perf_counter() - keyword_start) * 1000
+        record_span("keyword_search", keyword_start, hits=len(keyword_ranking))
+
+        candidates = reciprocal_rank_fusion([vector_ranking, keyword_ranking])[:max(self.rerank_top_n, self.k)]
+        for chunk_id in candidates:
+            if chunk_id not in docs:
+                doc = self.store.docstore.search(chunk_id)
+                if not isinstance(doc, str):
+                    docs[chunk_id] = doc
+        candidates = [chunk_id for chunk_id in candidates if chunk_id in docs]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.rerank and len(candidates) > self.k:
+            rerank_start = time.perf_counter()
+            candidates, timings["rerank_ms"] = self._rerank(query, candidates, docs, self.budget_ms - elapsed_ms)
+            record_span("rerank", rerank_start, skipped=timings["rerank_ms"] is None)
+
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        self.last_timings = timings
+        return [docs[chunk_id] for chunk_id in candidates[:self.k]]
+
+    def _rerank(self, query, candidates, docs, remaining_ms):
+        """Order candidates by cross-encoder score, or keep them if the stage is skipped"""
+        global _rerank_ms
+        if _rerank_ms is not None and _rerank_ms > remaining_ms:
+            return candidates, None
+        if not _rerank_slots.acquire(blocking=False):
+            return candidates, None
+        try:
+            start = time.perf_counter()
+            scores = get_cross_encoder().predict([(query, docs[chunk_id].page_content) for chunk_id in candidates])
+            duration_ms = (time.perf_counter() - start) * 1000
+        finally:
+            _rerank_slots.release()
+        _rerank_ms = duration_ms if _rerank_ms is None else 0.8 * _rerank_ms + 0.2 * duration_ms
+        ranked = [chunk_id for _, chunk_id in sorted(zip(scores, candidates), key=lambda pair: -pair[0])]
+        return ranked, duration_ms
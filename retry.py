@@ -0,0 +1,182 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from groq import APIConnectionError, APIStatusError, APITimeoutError
+
+# Attempts per request and exponential backoff bounds (seconds)
+RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+# Consecutive failures that open a model's circuit, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Hedging: if the first token is later than the model's p95, also ask the fallback model
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_FALLBACK_MODEL = os.getenv("LLM_HEDGE_FALLBACK_MODEL", "llama-3.1-8b-instant")
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 200
+
+_breakers = {}
+_latencies = {}
+_registry_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+    def __init__(self, model, retry_in):
+        super().__init__(
+            f"The AI service ({model}) is failing repeatedly; requests are paused for {retry_in:.0f}s."
+        )
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    """Timeouts, connection failures, 429s and 5xx responses are worth retrying"""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt, error=None, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Delay before retry number attempt (0-based): Retry-After if given, else full-jitter exponential"""
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        return min(requested, cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops calling a model after repeated failures, then lets one trial request through"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def check(self, model):
+        """Raise CircuitOpenError unless a request may go ahead
+
+        Returns True if the request is the half-open trial; its caller must
+        then record its outcome, or release() it if it is cancelled first.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(model, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        """Give up the trial without an outcome (it was cancelled), so another request can be the trial"""
+        with self._lock:
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent time-to-first-token samples of one model"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def p95(self, min_samples=HEDGE_MIN_SAMPLES):
+        """95th percentile in seconds, or None until min_samples have been seen"""
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def get_breaker(model):
+    with _registry_lock:
+        return _breakers.setdefault(model, CircuitBreaker())
+
+
+def get_latency(model):
+    with _registry_lock:
+        return _latencies.setdefault(model, LatencyTracker())
+
+
+def hedge_model(model, has_images=False):
+    """Fallback model to hedge requests for model with, or None
+
+    Requests with image content are never hedged, as the fallback model is text-only.
+    """
+    if not HEDGE_ENABLED or not HEDGE_FALLBACK_MODEL or HEDGE_FALLBACK_MODEL == model or has_images:
+        return None
+    return HEDGE_FALLBACK_MODEL
+
+
+def policy_stats():
+    """Breaker state and p95 first-token latency per model"""
+    with _registry_lock:
+        models = set(_breakers) | set(_latencies)
+    stats = {}
+    for model in sorted(models):
+        p95 = get_latency(model).p95(min_samples=1)
+        stats[model] = {
+            "breaker": get_breaker(model).state,
+            "p95_ttft_ms": p95 * 1000 if p95 is not None else None,
+        }
+    return stats
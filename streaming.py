@@ -0,0 +1,35 @@
+import threading
+import time
+from tracing import annotate, record_span
+
+# Latest timing per stream label, e.g. {"pdf": {"ttft_ms": ..., "total_ms": ..., "chars": ...}}
+latest_timings = {}
+_timings_lock = threading.Lock()
+
+
+def timed_stream(chunks, label, start=None):
+    """Pass text chunks through, tracing time-to-first-token and total time
+
+    start (a time.perf_counter() value) should be taken when the request
+    began, so the measured time includes retrieval and the API round trip.
+    The "llm" span also reports render_ms, the time the consumer spent
+    between chunks (e.g. updating the page).
+    """
+    start = start or time.perf_counter()
+    llm_start = time.perf_counter()
+    first_token_ms = None
+    chars = 0
+    render_seconds = 0.0
+    for chunk in chunks:
+        if first_token_ms is None:
+            first_token_ms = (time.perf_counter() - start) * 1000
+            record_span("llm_first_token", llm_start)
+        chars += len(chunk)
+        handed_over = time.perf_counter()
+        yield chunk
+        render_seconds += time.perf_counter() - handed_over
+    total_ms = (time.perf_counter() - start) * 1000
+    with _timings_lock:
+        latest_timings[label] = {"ttft_ms": first_token_ms, "total_ms": total_ms, "chars": chars}
+    record_span("llm", llm_start, chars=chars, render_ms=round(render_seconds * 1000, 3))
+    annotate(ttft_ms=round(first_token_ms, 3) if first_token_ms is not None else None, response_chars=chars)
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import speech_recognition as sr
+from dotenv import load_dotenv
+from tracing import span
+
+# Load environment variables
+load_dotenv()
+
+# Speech-to-text engine: "google" (network) or "vosk" (local, CPU, streams partial results)
+STT_BACKEND = os.getenv("STT_BACKEND", "google")
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "vosk-model-small-en-us-0.15")
+STT_SAMPLE_RATE = 16000
+# Seconds of audio fed to a streaming engine per step when transcribing a file
+FILE_CHUNK_SECONDS = 0.25
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class GoogleBackend:
+    """Google Web Speech API via speech_recognition (whole utterance, no partial results)"""
+
+    name = "google"
+    streaming = False
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio):
+        """Text of an sr.AudioData; raises sr.UnknownValueError / sr.RequestError like recognize_google"""
+        return self.recognizer.recognize_google(audio)
+
+
+class VoskStream:
+    """One utterance being recognized by Vosk, fed raw 16-bit mono PCM"""
+
+    def __init__(self, model, sample_rate):
+        import vosk
+        self.recognizer = vosk.KaldiRecognizer(model, sample_rate)
+        self.segments = []
+
+    def feed(self, frames):
+        """Feed audio; returns the transcript so far (final segments plus the current partial)"""
+        if self.recognizer.AcceptWaveform(frames):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.segments.append(text)
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.segments + ([partial] if partial else []))
+
+    def finish(self):
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        if text:
+            self.segments.append(text)
+        return " ".join(self.segments)
+
+
+class VoskBackend:
+    """Local Vosk (Kaldi) recognizer; runs on the CPU and reports partial transcripts"""
+
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path=VOSK_MODEL_PATH):
+        try:
+            import vosk
+        except ImportError:
+            raise sr.RequestError("the vosk package is not installed (pip install vosk)")
+        if not os.path.isdir(model_path):
+            raise sr.RequestError(f"Vosk model not found at {model_path} (set VOSK_MODEL_PATH)")
+        start = time.perf_counter()
+        vosk.SetLogLevel(-1)
+        self.model = vosk.Model(model_path)
+        print(f"Loaded Vosk model {model_path} in {time.perf_counter() - start:.2f}s")
+
+    def start_stream(self, sample_rate=STT_SAMPLE_RATE):
+        return VoskStream(self.model, sample_rate)
+
+    def transcribe(self, audio):
+        stream = self.start_stream(audio.sample_rate)
+        stream.feed(audio.get_raw_data(convert_width=2))
+        text = stream.finish()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+STT_BACKENDS = {"google": GoogleBackend, "vosk": VoskBackend}
+
+
+def get_stt_backend(name=STT_BACKEND):
+    """Return the process-wide instance of a speech-to-text backend (models load once)"""
+    if name not in STT_BACKENDS:
+        raise sr.RequestError(f"unknown speech recognition backend '{name}'")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = STT_BACKENDS[name]()
+        return _backends[name]
+
+
+def rms(frames, sample_width=2):
+    """Root-mean-square energy of 16-bit PCM frames, comparable to Recognizer.energy_threshold"""
+    if sample_width != 2 or not frames:
+        return 0.0
+    samples = np.frombuffer(frames, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+def stream_microphone(backend, source, recognizer, on_partial=None, start_timeout=10, max_seconds=30):
+    """Recognize one utterance from an open microphone with a streaming backend
+
+    Frames go to the engine as they are read, and on_partial receives the
+    transcript so far. The utterance ends after recognizer.pause_threshold
+    seconds of audio below recognizer.energy_threshold once speech started.
+    Raises sr.WaitTimeoutError if nobody speaks within start_timeout seconds.
+    """
+    stream = backend.start_stream(source.SAMPLE_RATE)
+    seconds_per_buffer = source.CHUNK / source.SAMPLE_RATE
+    elapsed = 0.0
+    silence = 0.0
+    heard = False
+    last_partial = ""
+    while elapsed < max_seconds:
+        frames = source.stream.read(source.CHUNK)
+        if not frames:
+            break
+        elapsed += seconds_per_buffer
+        if rms(frames, source.SAMPLE_WIDTH) > recognizer.energy_threshold:
+            heard = True
+            silence = 0.0
+        elif heard:
+            silence += seconds_per_buffer
+            if silence >= recognizer.pause_threshold:
+                break
+        elif elapsed >= start_timeout:
+            raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+        partial = stream.feed(frames)
+        if on_partial and partial and partial != last_partial:
+            on_partial(partial)
+            last_partial = partial
+    text = stream.finish()
+    if not text:
+        raise sr.UnknownValueError()
+    return text
+
+
+def transcribe_file(backend, audio_file, on_partial=None):
+    """Transcribe a WAV/AIFF/FLAC file (path or file object) without a microphone"""
+    recognizer = sr.Recognizer()
+    with span("decode") as attributes, sr.AudioFile(audio_file) as source:
+        audio = recognizer.record(source)
+        attributes["audio_bytes"] = len(audio.frame_data)
+    if not backend.streaming:
+        with span("recognize"):
+            text = backend.transcribe(audio)
+        if on_partial:
+            on_partial(text)
+        return text
+    frames = audio.get_raw_data(convert_rate=STT_SAMPLE_RATE, convert_width=2)
+    with span("recognize"):
+        stream = backend.start_stream(STT_SAMPLE_RATE)
+        step = int(STT_SAMPLE_RATE * FILE_CHUNK_SECONDS) * 2
+        for offset in range(0, len(frames), step):
+            partial = stream.feed(frames[offset:offset + step])
+            if on_partial and partial:
+                on_partial(partial)
+        text = stream.finish()
+    if not text:
+        raise sr.UnknownValueError()
+    return text
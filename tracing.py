@@ -0,0 +1,289 @@
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Per-request trace records are appended to this file as JSON lines ("" disables the sink)
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join("traces", "requests.jsonl"))
+# Finished traces kept in memory (and reloaded from TRACE_PATH on start) for the latency dashboard
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "2000"))
+# Print a one-line stage breakdown of every finished trace
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+
+_current = contextvars.ContextVar("trace", default=None)
+_recent = deque(maxlen=TRACE_HISTORY)
+_recent_lock = threading.Lock()
+_history_loaded = False
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def resident_memory_mb():
+    """Resident memory of this process in MB, or None where it can't be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Trace:
+    """Timed stages (spans) and attributes of one request, e.g. a PDF answer or an ingestion run"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.status = "ok"
+        self.attributes = dict(attributes)
+        self.spans = []
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, end=None, **attributes):
+        """Record a stage that ran from start to end (time.perf_counter() values)"""
+        end = end or time.perf_counter()
+        entry = {
+            "name": name,
+            "start_ms": round((start - self.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+        if attributes:
+            entry["attributes"] = attributes
+        with self._lock:
+            self.spans.append(entry)
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def fail(self, error):
+        """Mark the request as failed even though the error was turned into a reply"""
+        self.status = "error"
+        self.annotate(error=f"{error.__class__.__name__}: {error}")
+
+    def to_record(self):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "timestamp": round(self.started_at, 3),
+                "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+                "status": self.status,
+                "attributes": dict(self.attributes),
+                "spans": list(self.spans),
+                "resources": {
+                    # CPU time of the thread that opened the trace, so background stages are not counted
+                    "cpu_ms": round((time.thread_time() - self._cpu_start) * 1000, 3),
+                    "rss_mb": resident_memory_mb(),
+                },
+            }
+
+
+class _JsonlSink:
+    """Appends records to a JSONL file from a background thread, off the request path"""
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="trace-sink", daemon=True).start()
+
+    def write(self, record):
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while not self._queue.empty():
+                records.append(self._queue.get_nowait())
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                print(f"Could not write traces to {self.path}: {e}")
+
+
+def _get_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is None and TRACE_PATH:
+            _sink = _JsonlSink(TRACE_PATH)
+    return _sink
+
+
+def _summary(record):
+    stages = ", ".join(f"{s['name']} {s['duration_ms']:.0f} ms" for s in record["spans"])
+    status = "" if record["status"] == "ok" else f" ({record['status']})"
+    return f"[{record['name']}] {record['duration_ms']:.0f} ms{status}" + (f": {stages}" if stages else "")
+
+
+def _finish(current):
+    record = current.to_record()
+    _load_history()
+    with _recent_lock:
+        _recent.append(record)
+    sink = _get_sink()
+    if sink:
+        sink.write(record)
+    if TRACE_LOG:
+        print(_summary(record))
+
+
+def current_trace():
+    """The trace of the request running in this context, or None"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Trace one request: spans recorded inside the block belong to it, and it is written out at the end
+
+    Inside another trace (e.g. an image preprocessed while a batch job is
+    traced) this becomes a span of the outer trace instead of a new record.
+    """
+    parent = _current.get()
+    if parent is not None:
+        with span(name, **attributes):
+            yield parent
+        return
+    current = Trace(name, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        # The caller stopped reading a streamed reply
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An abandoned generator finalized from another context
+            pass
+        _finish(current)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time a block as a stage of the current trace (a no-op outside a trace)
+
+    Yields the span's attribute dict, for values only known at the end.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        current = _current.get()
+        if current is not None:
+            current.add_span(name, start, **attributes)
+
+
+def record_span(name, start, **attributes):
+    """Record a stage measured by the caller, from start (time.perf_counter()) until now"""
+    current = _current.get()
+    if current is not None:
+        current.add_span(name, start, **attributes)
+
+
+def annotate(**attributes):
+    """Attach attributes (token counts, payload sizes...) to the current trace"""
+    current = _current.get()
+    if current is not None:
+        current.annotate(**attributes)
+
+
+def record_error(error):
+    """Mark the current trace as failed, for errors turned into a friendly reply"""
+    current = _current.get()
+    if current is not None:
+        current.fail(error)
+
+
+def _load_history():
+    """Seed the in-memory history from the JSONL sink, so the dashboard survives restarts
+
+    Runs before the first trace of this process is kept, so nothing is counted twice.
+    """
+    global _history_loaded
+    with _recent_lock:
+        if _history_loaded:
+            return
+        _history_loaded = True
+        if not TRACE_PATH or not os.path.exists(TRACE_PATH):
+            return
+        lines = deque(maxlen=TRACE_HISTORY)
+        try:
+            with open(TRACE_PATH, encoding="utf-8") as f:
+                lines.extend(f)
+        except OSError:
+            return
+        loaded = []
+        for line in lines:
+            try:
+                loaded.append(json.loads(line))
+            except ValueError:
+                continue
+        _recent.extend(loaded)
+
+
+def recent_traces(name=None):
+    """Finished trace records, oldest first, optionally only those of one request type"""
+    _load_history()
+    with _recent_lock:
+        records = list(_recent)
+    return [record for record in records if name is None or record["name"] == name]
+
+
+def _samples(record):
+    """(stage, milliseconds) pairs of a record: the total, every span and every *_ms attribute"""
+    yield "total", record["duration_ms"]
+    for key, value in record["attributes"].items():
+        if key.endswith("_ms") and isinstance(value, (int, float)):
+            yield key[:-3], value
+    for entry in record["spans"]:
+        yield entry["name"], entry["duration_ms"]
+        for key, value in entry.get("attributes", {}).items():
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                yield f"{entry['name']}.{key[:-3]}", value
+
+
+def latency_summary(name=None):
+    """Latency percentiles per request type and stage over the recent traces"""
+    samples = {}
+    errors = {}
+    for record in recent_traces(name):
+        errors[record["name"]] = errors.get(record["name"], 0) + (record["status"] == "error")
+        for stage, value in _samples(record):
+            samples.setdefault((record["name"], stage), []).append(value)
+    rows = []
+    for (request, stage), values in sorted(samples.items()):
+        rows.append({
+            "request": request,
+            "stage": stage,
+            "count": len(values),
+            "p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "p99_ms": round(float(np.percentile(values, 99)), 1),
+            "max_ms": round(float(np.max(values)), 1),
+            "errors": errors[request] if stage == "total" else None,
+        })
+    return rows
@@ -0,0 +1,565 @@
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_DIR = "faiss_index"
+DOCSTORE_FILE = "docstore.db"
+# Each named collection (e.g. a user or project) is a separate index in INDEX_DIR/<name>
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+# Files written by FAISS.save_local before the SQLite docstore existed
+LEGACY_FILES = ("index.faiss", "index.pkl", "manifest.json")
+
+# Index type: "flat" (exact search), "ivf", "hnsw" or "pq" (IVF with product quantization)
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+# Approximate indexes are only trained once the corpus has this many chunks
+MIN_TRAIN_VECTORS = int(os.getenv("MIN_TRAIN_VECTORS", "10000"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = sqrt(number of chunks)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+PQ_M = int(os.getenv("PQ_M", "48"))
+
+# Serialize index updates to the same collection coming from different Streamlit sessions
+_index_locks = {}
+_layout_lock = threading.Lock()
+_layout_checked = False
+
+
+def _migrate_root_layout():
+    """Move an index saved directly in INDEX_DIR (before collections) into the default collection
+
+    Runs once per process, before any collection is opened.
+    """
+    global _layout_checked
+    if _layout_checked:
+        return
+    _layout_checked = True
+    if not os.path.isdir(INDEX_DIR):
+        return
+    names = [
+        name for name in os.listdir(INDEX_DIR)
+        if os.path.isfile(os.path.join(INDEX_DIR, name))
+        and (name.startswith(DOCSTORE_FILE) or name in LEGACY_FILES or re.match(r"(index|ids)-\d+\.(faiss|npy)$", name))
+    ]
+    if not names:
+        return
+    target = os.path.join(INDEX_DIR, DEFAULT_COLLECTION)
+    os.makedirs(target, exist_ok=True)
+    for name in names:
+        os.replace(os.path.join(INDEX_DIR, name), os.path.join(target, name))
+    print(f"Moved the existing index in {INDEX_DIR} to the '{DEFAULT_COLLECTION}' collection")
+
+
+def collection_dir(collection=DEFAULT_COLLECTION):
+    """Directory of a named collection's index; raises ValueError for names that aren't allowed"""
+    if not _COLLECTION_NAME.match(collection or ""):
+        raise ValueError(
+            "Collection names must start with a letter or digit and contain only "
+            "letters, digits, '-', '_' and '.' (at most 64 characters)"
+        )
+    with _layout_lock:
+        _migrate_root_layout()
+    return os.path.join(INDEX_DIR, collection)
+
+
+def list_collections():
+    """Names of the collections that have a saved index"""
+    with _layout_lock:
+        _migrate_root_layout()
+    if not os.path.isdir(INDEX_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(INDEX_DIR)
+        if os.path.exists(os.path.join(INDEX_DIR, name, DOCSTORE_FILE))
+    )
+
+
+def content_hash(data):
+    """SHA-256 hex digest of a document's raw bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _nlist(count):
+    return IVF_NLIST or max(1, int(math.sqrt(count)))
+
+
+def min_train_vectors(index_type, count):
+    """Vectors needed before an index of index_type can be trained on a corpus of count
+
+    IVF clustering wants about 39 points per list and 8-bit PQ codebooks
+    need 256, below which faiss fails or trains poor centroids.
+    """
+    if index_type in ("ivf", "pq"):
+        return max(MIN_TRAIN_VECTORS, 256, 39 * _nlist(count))
+    return MIN_TRAIN_VECTORS
+
+
+def factory_string(index_type, dim, count):
+    """faiss.index_factory description of an index type for count vectors of size dim"""
+    nlist = _nlist(count)
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}"
+    if index_type == "pq":
+        # The number of sub-quantizers must divide the vector size
+        m = max(d for d in range(1, min(PQ_M, dim) + 1) if dim % d == 0)
+        return f"IVF{nlist},PQ{m}"
+    if index_type == "flat":
+        return "Flat"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def configure_search(index, nprobe=None):
+    """Apply query-time parameters (IVF nprobe, HNSW efSearch) to a loaded index"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe or IVF_NPROBE
+    except RuntimeError:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def build_index(index_type, vectors):
+    """Create, train and fill an index of the given type"""
+    index = faiss.index_factory(vectors.shape[1], factory_string(index_type, vectors.shape[1], len(vectors)))
+    if not index.is_trained:
+        index.train(vectors)
+    _enable_reconstruct(index)
+    index.add(vectors)
+    return configure_search(index)
+
+
+def _enable_reconstruct(index):
+    """IVF indexes need a direct map for reconstruct(), which MMR search relies on
+
+    Labels are always 0..ntotal-1 because chunks are never removed from an
+    IVF index in place (see DocumentIndex._delete_chunks), so an array map works.
+    """
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+
+
+def _read_index(path, mmap):
+    if mmap:
+        # Zero-copy mapping of the whole index (newer faiss), else of IVF lists only
+        for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            if hasattr(faiss, flag):
+                try:
+                    return faiss.read_index(path, getattr(faiss, flag) | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError:
+                    continue
+    return faiss.read_index(path)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text,
+    content='chunks',
+    content_rowid='id',
+    tokenize="unicode61 tokenchars '-_'"
+);
+"""
+
+
+def _connect(directory, read_only=False):
+    path = os.path.join(directory, DOCSTORE_FILE)
+    if read_only:
+        return sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    if _read_meta(conn, "keyword_index") is None:
+        # Docstores created before the keyword index existed
+        conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+        conn.execute("REPLACE INTO meta (key, value) VALUES ('keyword_index', 'fts5')")
+        conn.commit()
+    return conn
+
+
+def _read_meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _generation_paths(directory, generation):
+    return (
+        os.path.join(directory, f"index-{generation}.faiss"),
+        os.path.join(directory, f"ids-{generation}.npy"),
+    )
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Chunk text and metadata in SQLite, read one row at a time for search hits
+
+    An FTS5 table over the same rows is the keyword (BM25) index. Deleted
+    chunks are only marked (deleted = 1) until the next save, and kept for
+    one more save after that (deleted = 2), so readers still holding the
+    previous index generation can resolve their hits.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def add(self, texts):
+        rows = [
+            (int(chunk_id), doc.metadata.get("source", ""), doc.page_content, json.dumps(doc.metadata, default=str))
+            for chunk_id, doc in texts.items()
+        ]
+        with self._lock:
+            self.conn.executemany("INSERT INTO chunks (id, doc_id, text, metadata) VALUES (?, ?, ?, ?)", rows)
+            self.conn.executemany(
+                "INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)",
+                [(chunk_id, text) for chunk_id, _, text, _ in rows]
+            )
+
+    def delete(self, ids):
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE chunks SET deleted = 1 WHERE id = ? AND deleted = 0",
+                [(int(chunk_id),) for chunk_id in ids]
+            )
+
+    def search(self, search):
+        with self._lock:
+            row = self.conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (int(search),)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=str(search), page_content=row[0], metadata=json.loads(row[1]))
+
+    def keyword_search(self, query, limit):
+        """IDs of the chunks best matching the query's words by BM25, best first"""
+        terms = re.findall(r"[\w\-]+", query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', "") + '"' for term in terms)
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT chunks_fts.rowid FROM chunks_fts JOIN chunks ON chunks.id = chunks_fts.rowid "
+                    "WHERE chunks_fts MATCH ? AND chunks.deleted = 0 ORDER BY bm25(chunks_fts) LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            # Read-only docstore written before the keyword index existed
+            print(f"Keyword search unavailable: {e}")
+            return []
+        return [row[0] for row in rows]
+
+    def generation(self):
+        """Index generation currently committed on disk (None before the first save)"""
+        with self._lock:
+            generation = _read_meta(self.conn, "generation")
+        return int(generation) if generation is not None else None
+
+
+class _PositionMap(Mapping):
+    """Read-only index position -> chunk ID map over a memory-mapped int64 array"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self.ids):
+            raise KeyError(position)
+        return int(self.ids[position])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+
+def load_store(embeddings, directory=None, mmap=False):
+    """Load the current generation of a saved vector store (by default the default collection's)
+
+    With mmap, the FAISS index and the position -> chunk ID array are
+    memory-mapped read-only and chunk text stays in SQLite until a search
+    hits it, so load time and resident memory don't grow with the corpus.
+    Indexes that will be updated must be loaded without mmap.
+    """
+    directory = directory or collection_dir()
+    if not os.path.exists(os.path.join(directory, DOCSTORE_FILE)):
+        raise FileNotFoundError(f"No vector store in {directory}")
+    conn = _connect(directory, read_only=True)
+    generation = _read_meta(conn, "generation")
+    if generation is None:
+        conn.close()
+        raise FileNotFoundError(f"No vector store in {directory}")
+    index_path, ids_path = _generation_paths(directory, generation)
+    index = _read_index(index_path, mmap)
+    ids = np.load(ids_path, mmap_mode="r" if mmap else None)
+    index_to_docstore_id = _PositionMap(ids) if mmap else {position: int(i) for position, i in enumerate(ids)}
+    store = FAISS(embeddings, configure_search(index), SQLiteDocstore(conn), index_to_docstore_id)
+    # Lets callers tell index versions apart (e.g. to scope cached answers)
+    store.generation = int(generation)
+    # Bytes of the index and ID files, mapped (mmap) or read into memory
+    store.size_bytes = os.path.getsize(index_path) + os.path.getsize(ids_path)
+    return store
+
+
+class DocumentIndex:
+    """FAISS index that is updated in place, one document at a time
+
+    A manifest stored with the docstore records the content hash and chunk
+    IDs of every document, so unchanged documents are never re-embedded and
+    changed ones can be replaced without touching the rest of the corpus.
+
+    Each save writes a new generation of the raw FAISS index file and its
+    position -> chunk ID array, then switches to it in the same SQLite commit
+    as the chunk and manifest changes.
+    """
+
+    def __init__(self, embeddings, directory=None):
+        self.embeddings = embeddings
+        self.directory = directory = directory or collection_dir()
+        self.store = None
+        self.manifest = {
+            "version": 0,
+            "next_chunk_id": 0,
+            "documents": {},
+            "index": {"type": "flat", "trained_on": 0},
+        }
+        self._migrated = False
+        os.makedirs(directory, exist_ok=True)
+        self.conn = _connect(directory)
+        self._load()
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def _load(self):
+        manifest = _read_meta(self.conn, "manifest")
+        if manifest is not None:
+            self.manifest.update(json.loads(manifest))
+        generation = _read_meta(self.conn, "generation")
+        if generation is not None:
+            index_path, ids_path = _generation_paths(self.directory, generation)
+            index_to_docstore_id = {position: int(i) for position, i in enumerate(np.load(ids_path))}
+            self.store = FAISS(
+                self.embeddings,
+                configure_search(_read_index(index_path, mmap=False)),
+                SQLiteDocstore(self.conn),
+                index_to_docstore_id
+            )
+        elif manifest is None and os.path.exists(os.path.join(self.directory, "index.pkl")):
+            self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        """Convert an index saved with FAISS.save_local (pickled docstore)"""
+        index = faiss.read_index(os.path.join(self.directory, "index.faiss"))
+        with open(os.path.join(self.directory, "index.pkl"), "rb") as f:
+            docstore, old_index_to_docstore_id = pickle.load(f)
+
+        new_ids = {old_id: position for position, old_id in sorted(old_index_to_docstore_id.items())}
+        self.store = FAISS(self.embeddings, configure_search(index), SQLiteDocstore(self.conn), {})
+        self.store.docstore.add({new_ids[old_id]: docstore.search(old_id) for old_id in new_ids})
+        self.store.index_to_docstore_id = {position: position for position in range(len(new_ids))}
+        self.manifest["next_chunk_id"] = len(new_ids)
+
+        legacy_manifest = os.path.join(self.directory, "manifest.json")
+        if os.path.exists(legacy_manifest):
+            with open(legacy_manifest, "r") as f:
+                self.manifest.update(json.load(f))
+            for entry in self.manifest["documents"].values():
+                entry["chunk_ids"] = [new_ids[old_id] for old_id in entry["chunk_ids"] if old_id in new_ids]
+        self._migrated = True
+        print(f"Migrated {len(new_ids)} chunks from the pickled index in {self.directory}")
+
+    def documents(self):
+        """IDs of all indexed documents"""
+        return sorted(self.manifest["documents"])
+
+    def is_current(self, doc_id, digest):
+        """True if doc_id is indexed with exactly this content hash"""
+        entry = self.manifest["documents"].get(doc_id)
+        return entry is not None and entry["hash"] == digest
+
+    def begin_document(self, doc_id, digest):
+        """Drop any previous version of a document before its new chunks are added"""
+        self.remove_document(doc_id)
+        self.manifest["documents"][doc_id] = {"hash": digest, "chunk_ids": []}
+        self.manifest["version"] += 1
+
+    def add_chunks(self, doc_id, chunks, vectors):
+        """Append already-embedded chunks to a document started with begin_document"""
+        if not len(chunks):
+            return
+        entry = self.manifest["documents"][doc_id]
+        first_id = self.manifest["next_chunk_id"]
+        ids = list(range(first_id, first_id + len(chunks)))
+        self.manifest["next_chunk_id"] += len(chunks)
+        if self.store is None:
+            dim = len(vectors[0])
+            self.store = FAISS(self.embeddings, faiss.IndexFlatL2(dim), SQLiteDocstore(self.conn), {})
+        text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)]
+        self.store.add_embeddings(text_embeddings, metadatas=[chunk.metadata for chunk in chunks], ids=ids)
+        entry["chunk_ids"].extend(ids)
+
+    def add_document(self, doc_id, digest, chunks):
+        """Add (or replace) a document's chunks in the index"""
+        self.begin_document(doc_id, digest)
+        if chunks:
+            vectors = self.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            self.add_chunks(doc_id, chunks, vectors)
+
+    def remove_document(self, doc_id):
+        """Remove a document's chunks from the index"""
+        entry = self.manifest["documents"].pop(doc_id, None)
+        if entry is None:
+            return False
+        if entry["chunk_ids"] and self.store is not None:
+            self._delete_chunks(entry["chunk_ids"])
+        self.manifest["version"] += 1
+        return True
+
+    def _delete_chunks(self, ids):
+        index = self.store.index
+        if isinstance(index, faiss.IndexFlat):
+            self.store.delete(ids)
+            return
+
+        # IVF labels don't shift on removal and HNSW can't remove at all, so
+        # approximate indexes are refilled with the remaining vectors instead
+        ids = set(ids)
+        keep = [pos for pos, chunk_id in sorted(self.store.index_to_docstore_id.items()) if chunk_id not in ids]
+        vectors = index.reconstruct_n(0, index.ntotal)[keep]
+        index.reset()
+        _enable_reconstruct(index)
+        index.add(vectors)
+        self.store.docstore.delete(list(ids))
+        self.store.index_to_docstore_id = {
+            new_pos: self.store.index_to_docstore_id[old_pos] for new_pos, old_pos in enumerate(keep)
+        }
+
+    def train(self, index_type=INDEX_TYPE):
+        """Convert the index to index_type once the corpus is large enough
+
+        Chunks are first added to an exact flat index. When the corpus reaches
+        MIN_TRAIN_VECTORS (or more, see min_train_vectors), the vectors are
+        used to train an approximate index (IVF centroids, PQ codebooks or an
+        HNSW graph) that replaces it.
+        Returns True if the index was rebuilt.
+        """
+        current = self.manifest["index"]["type"]
+        if self.store is None or current == index_type:
+            return False
+        count = self.store.index.ntotal
+        if index_type != "flat" and count < min_train_vectors(index_type, count):
+            return False
+
+        vectors = self.store.index.reconstruct_n(0, count)
+        self.store.index = build_index(index_type, vectors)
+        self.manifest["index"] = {"type": index_type, "trained_on": count}
+        self.manifest["version"] += 1
+        print(f"Trained {index_type} index ({factory_string(index_type, vectors.shape[1], count)}) on {count} chunks")
+        return True
+
+    def save(self):
+        """Write a new index generation and commit it with the docstore and manifest"""
+        generation = _read_meta(self.conn, "generation")
+        if self.store is not None:
+            generation = int(generation or 0) + 1
+            index_path, ids_path = _generation_paths(self.directory, generation)
+            faiss.write_index(self.store.index, index_path)
+            ids = [self.store.index_to_docstore_id[position] for position in range(self.store.index.ntotal)]
+            np.save(ids_path, np.array(ids, dtype=np.int64))
+            self.conn.execute("REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(generation),))
+
+        self.conn.execute(
+            "INSERT INTO chunks_fts (chunks_fts, rowid, text) SELECT 'delete', id, text FROM chunks WHERE deleted = 2"
+        )
+        self.conn.execute("DELETE FROM chunks WHERE deleted = 2")
+        self.conn.execute("UPDATE chunks SET deleted = 2 WHERE deleted = 1")
+        self.conn.execute("REPLACE INTO meta (key, value) VALUES ('manifest', ?)", (json.dumps(self.manifest),))
+        self.conn.commit()
+
+        if generation is not None:
+            self._remove_old_generations(int(generation))
+        if self._migrated:
+            for name in LEGACY_FILES:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self._migrated = False
+
+    def _remove_old_generations(self, generation):
+        """Delete index files older than the previous generation, which readers may still use"""
+        for name in os.listdir(self.directory):
+            stem, _, extension = name.partition(".")
+            prefix, _, number = stem.partition("-")
+            if prefix in ("index", "ids") and extension in ("faiss", "npy") and number.isdigit():
+                if int(number) < generation - 1:
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        # Still memory-mapped somewhere (Windows); retried on the next save
+                        pass
+
+    def close(self):
+        """Discard uncommitted changes and close the docstore connection"""
+        self.conn.rollback()
+        self.conn.close()
+
+
+def indexed_documents(directory=None):
+    """IDs of the documents recorded in the manifest, without loading the index"""
+    directory = directory or collection_dir()
+    if not os.path.exists(os.path.join(directory, DOCSTORE_FILE)):
+        return []
+    conn = _connect(directory, read_only=True)
+    try:
+        manifest = _read_meta(conn, "manifest")
+    finally:
+        conn.close()
+    return sorted(json.loads(manifest)["documents"]) if manifest else []
+
+
+def update_index(embeddings, update, directory=None):
+    """Load the index, apply update(index) under the collection's lock and save it
+
+    Nothing is written if update raises.
+    """
+    directory = directory or collection_dir()
+    with _layout_lock:
+        lock = _index_locks.setdefault(os.path.abspath(directory), threading.Lock())
+    with lock:
+        index = DocumentIndex(embeddings, directory)
+        try:
+            result = update(index)
+            index.save()
+        except BaseException:
+            index.close()
+            raise
+        return index, result
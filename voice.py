@@ -4,62 +4,284 @@ import speech_recognition as sr
 from gtts import gTTS
 from playsound import playsound
 from dotenv import load_dotenv
-from groq import Groq
+import hashlib
 import io
-import base64
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from streaming import timed_stream
+from stt import STT_BACKEND, STT_SAMPLE_RATE, get_stt_backend, stream_microphone, transcribe_file
+from llm_client import stream_chat
+from tracing import annotate, record_error, record_span, span, trace
 
 # Load environment variables
 load_dotenv()
 
+# Seconds a microphone noise calibration is reused before measuring again
+NOISE_CALIBRATION_TTL = int(os.getenv("NOISE_CALIBRATION_TTL", "300"))
+UNRECOGNIZED = "Could not understand audio"
+RECOGNITION_ERROR = "Error with speech recognition service"
+
+TTS_LANGUAGE = "en"
+# Synthesized sentences kept in memory, keyed by a hash of their text
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "256"))
+# Short sentences are merged until a piece has at least this many characters
+TTS_MIN_CHARS = 40
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_player = None
+_player_lock = threading.Lock()
+
+
+def split_sentences(text, min_chars=TTS_MIN_CHARS):
+    """Split text into sentence-sized pieces for synthesis"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        current = f"{current} {sentence}".strip()
+        if len(current) >= min_chars:
+            pieces.append(current)
+            current = ""
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class SpeechPlayer:
+    """Speaks text sentence by sentence without blocking the caller
+
+    One thread synthesizes sentences into in-memory MP3 buffers while a
+    second plays them, so the first sentence is heard while later ones are
+    still being synthesized. Audio is cached by text hash. Starting new
+    speech interrupts whatever is playing.
+    """
+
+    def __init__(self, language=TTS_LANGUAGE, cache_size=TTS_CACHE_SIZE):
+        self.language = language
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._sentences = queue.Queue()
+        self._audio = queue.Queue(maxsize=4)
+        self._generation = 0
+        self._pending = 0  # sentences queued but not yet played or dropped
+        self._mixer = None
+        threading.Thread(target=self._synthesize_loop, name="tts-synthesize", daemon=True).start()
+        threading.Thread(target=self._play_loop, name="tts-play", daemon=True).start()
+
+    @property
+    def speaking(self):
+        return self._pending > 0
+
+    def _done(self):
+        with self._lock:
+            self._pending -= 1
+
+    def speak(self, text):
+        """Start speaking text in the background, replacing any current speech"""
+        self.stop()
+        for sentence in split_sentences(text):
+            self.say(sentence)
+
+    def say(self, sentence):
+        """Queue one more sentence after whatever is already queued"""
+        if sentence.strip():
+            with self._lock:
+                self._pending += 1
+            self._sentences.put((self._generation, sentence))
+
+    def stop(self):
+        with self._lock:
+            self._generation += 1
+        if self._mixer:
+            self._mixer.music.stop()
+
+    def synthesize(self, text):
+        """MP3 bytes for text, from the cache when it was spoken before"""
+        key = hashlib.sha256(f"{self.language}\0{text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        with trace("tts", chars=len(text)):
+            buffer = io.BytesIO()
+            gTTS(text=text, lang=self.language).write_to_fp(buffer)
+            audio = buffer.getvalue()
+            annotate(audio_bytes=len(audio))
+        with self._lock:
+            self._cache[key] = audio
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return audio
+
+    def _synthesize_loop(self):
+        while True:
+            generation, sentence = self._sentences.get()
+            if generation != self._generation:
+                self._done()
+                continue
+            try:
+                self._audio.put((generation, self.synthesize(sentence)))
+            except Exception as e:
+                print(f"Error in text-to-speech: {e}")
+                self._done()
+
+    def _play_loop(self):
+        while True:
+            generation, audio = self._audio.get()
+            try:
+                if generation == self._generation:
+                    self._play(audio, generation)
+            except Exception as e:
+                print(f"Error playing speech: {e}")
+            finally:
+                self._done()
+
+    def _play(self, audio, generation):
+        """Play MP3 bytes with pygame, falling back to playsound on a temp file"""
+        if self._mixer is None:
+            try:
+                import pygame
+                pygame.mixer.init()
+                self._mixer = pygame.mixer
+            except Exception:
+                self._mixer = False
+        if self._mixer:
+            self._mixer.music.load(io.BytesIO(audio), "mp3")
+            self._mixer.music.play()
+            while self._mixer.music.get_busy() and generation == self._generation:
+                time.sleep(0.05)
+            return
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as fp:
+            fp.write(audio)
+        try:
+            playsound(fp.name)
+        finally:
+            os.unlink(fp.name)
+
+
+def get_speech_player():
+    """Return the process-wide speech player (there is one audio device)"""
+    global _player
+    with _player_lock:
+        if _player is None:
+            _player = SpeechPlayer()
+    return _player
+
 
 class VoiceSystem:
-    def __init__(self):
+    def __init__(self, backend=STT_BACKEND):
         self.recognizer = sr.Recognizer()
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.backend_name = backend
+        self.calibrated_at = None
+
+    def calibrate(self, source, force=False):
+        """Measure ambient noise, at most once per NOISE_CALIBRATION_TTL seconds"""
+        if force or self.calibrated_at is None or time.monotonic() - self.calibrated_at > NOISE_CALIBRATION_TTL:
+            start = time.perf_counter()
+            self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
+            self.calibrated_at = time.monotonic()
+            record_span("calibrate", start, energy_threshold=round(self.recognizer.energy_threshold))
 
-    def listen(self):
-        """Capture audio from microphone and convert to text"""
-        with sr.Microphone() as source:
-            print("Listening...")
-            self.recognizer.adjust_for_ambient_noise(source)
-            audio = self.recognizer.listen(source)
+    def listen(self, on_partial=None):
+        """Capture audio from microphone and convert to text
 
+        With a streaming backend (vosk) on_partial receives the transcript
+        while the user is still talking.
+        """
+        with trace("stt", backend=self.backend_name, source="microphone"):
             try:
-                text = self.recognizer.recognize_google(audio)
-                print(f"You said: {text}")
+                backend = get_stt_backend(self.backend_name)
+                with sr.Microphone(sample_rate=STT_SAMPLE_RATE if backend.streaming else None) as source:
+                    print("Listening...")
+                    self.calibrate(source)
+                    if backend.streaming:
+                        text = stream_microphone(backend, source, self.recognizer, on_partial)
+                    else:
+                        with span("record") as attributes:
+                            audio = self.recognizer.listen(source)
+                            attributes["audio_bytes"] = len(audio.frame_data)
+                        with span("recognize"):
+                            text = backend.transcribe(audio)
+                annotate(transcript_chars=len(text))
+                return text
+            except (sr.UnknownValueError, sr.WaitTimeoutError):
+                annotate(recognized=False)
+                return UNRECOGNIZED
+            except sr.RequestError as e:
+                record_error(e)
+                return f"{RECOGNITION_ERROR}: {e}"
+
+    def transcribe_file(self, audio_file, on_partial=None):
+        """Convert a WAV/AIFF/FLAC recording to text (no microphone needed)"""
+        with trace("stt", backend=self.backend_name, source="file"):
+            try:
+                text = transcribe_file(get_stt_backend(self.backend_name), audio_file, on_partial)
+                annotate(transcript_chars=len(text))
                 return text
             except sr.UnknownValueError:
-                return "Could not understand audio"
+                annotate(recognized=False)
+                return UNRECOGNIZED
             except sr.RequestError as e:
-                return f"Error with speech recognition service: {e}"
+                record_error(e)
+                return f"{RECOGNITION_ERROR}: {e}"
+            except ValueError as e:
+                # Raised by sr.AudioFile for unsupported formats
+                record_error(e)
+                return f"{RECOGNITION_ERROR}: {e}"
+
+    @staticmethod
+    def is_error(text):
+        """True for the messages listen() returns instead of a transcript"""
+        return not text or text == UNRECOGNIZED or text.startswith(RECOGNITION_ERROR)
 
     def speak(self, text):
-        """Convert text to speech and play it"""
-        try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as fp:
-                tts = gTTS(text=text, lang='en')
-                tts.save(fp.name)
-                fp.close()
-                playsound(fp.name)
-                os.unlink(fp.name)  # Delete the temporary file
-        except Exception as e:
-            print(f"Error in text-to-speech: {e}")
+        """Convert text to speech and play it in the background"""
+        get_speech_player().speak(text)
+
+    def stop_speaking(self):
+        get_speech_player().stop()
+
+    @property
+    def speaking(self):
+        return get_speech_player().speaking
+
+    def speak_stream(self, chunks):
+        """Pass streamed text through, speaking each sentence as soon as it is complete"""
+        player = get_speech_player()
+        player.stop()
+        pending = ""
+        for chunk in chunks:
+            pending += chunk
+            *complete, pending = _SENTENCE_END.split(pending)
+            for sentence in complete:
+                player.say(sentence)
+            yield chunk
+        player.say(pending)
+
+    def stream_voice_chat(self, prompt):
+        """Stream a voice conversation reply from the Groq API as it is generated"""
+        start = time.perf_counter()
+        with trace("voice", question_chars=len(prompt)):
+            try:
+                response = stream_chat(
+                    [{"role": "user", "content": prompt}],
+                    "llama3-70b-8192",
+                    temperature=0.7
+                )
+                yield from timed_stream(response, "voice", start)
+            except Exception as e:
+                record_error(e)
+                yield f"Error in voice chat: {str(e)}"
 
     def voice_chat(self, prompt):
         """Handle voice conversation with Groq API"""
-        try:
-            response = self.groq_client.chat.completions.create(
-                model="llama3-70b-8192",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error in voice chat: {str(e)}"
+        return "".join(self.stream_voice_chat(prompt))
 
 
-def get_voice_system():
+def get_voice_system(backend=STT_BACKEND):
     """Factory function to get voice system instance"""
-    return VoiceSystem()
+    return VoiceSystem(backend)
 